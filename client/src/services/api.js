@@ -106,7 +106,7 @@ export const postService = {
   getAllPosts: async () => {
     try {
       const response = await api.get('/posts/');
-      return response.data;
+      return response.data.results;
     } catch (error) {
       if (error.response?.status === 401) {
         localStorage.removeItem('token');
@@ -117,7 +117,7 @@ export const postService = {
   getUnmoderatedPosts: async () => {
     try {
       const response = await api.get('/posts/unmoderated/');
-      return response.data;
+      return response.data.results;
     } catch (error) {
       if (error.response?.status === 401) {
         localStorage.removeItem('token');
@@ -157,8 +157,8 @@ export const postService = {
   },
   getCommentsByPostId: async (postId) => {
     try {
-      const response = await api.get(`/comments/?post=${postId}`);
-      return response.data;
+      const response = await api.get(`/posts/${postId}/comments/`);
+      return response.data.results;
     } catch (error) {
       console.error('Error fetching comments:', error);
       throw error;
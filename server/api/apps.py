@@ -7,11 +7,26 @@ class ApiConfig(AppConfig):
 
     def ready(self):
         from django.contrib.auth.models import Group
+        from django.db.backends.signals import connection_created
         from django.db.models.signals import post_migrate
+        from . import signals  # noqa: F401
+        from .metrics import install_query_wrapper
 
         def create_groups(sender, **kwargs):
             Group.objects.get_or_create(name='Administrators')
             Group.objects.get_or_create(name='Moderators')
             Group.objects.get_or_create(name='Authors')
 
+        def ensure_search_index(sender, using, **kwargs):
+            # SQLite drops triggers when a later migration rebuilds
+            # api_post or api_comment, so put them back after every migrate.
+            from django.db import connections
+            from . import search
+            connection = connections[using]
+            if {'api_post', 'api_comment'} <= set(connection.introspection.table_names()):
+                search.install(connection)
+
+        # Counts queries for api.metrics; a no-op outside a measured request
+        connection_created.connect(install_query_wrapper)
         post_migrate.connect(create_groups, sender=self)
+        post_migrate.connect(ensure_search_index, sender=self)
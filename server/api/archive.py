@@ -0,0 +1,116 @@
+"""
+Moving old posts out of the live tables.
+
+``archive_content`` moves posts whose last activity is older than
+ARCHIVE_AFTER_DAYS into ArchivedPost, and their comments into
+ArchivedComment. It works in short batches, each in its own transaction,
+so feeds and writes keep running. Pending posts stay in the moderation
+queue however old they are. An archived post's likes and timeline entries
+are dropped; its counters are kept as they were.
+
+An archived post stays readable at ``GET /api/posts/<id>/`` with the same
+payload as before, and its comments at ``/api/posts/<id>/comments/`` and
+``/api/comments/<id>/``. It no longer appears in feeds or search and can't
+be liked or commented on. Its image stays referenced (api/media.py).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import cache
+from .models import ArchivedComment, ArchivedPost, Comment, Post, PostLike, TimelineEntry, User
+
+# Post columns kept in ArchivedPost.data
+ARCHIVED_FIELDS = (
+    'title', 'content', 'rejected', 'moderator_id', 'like_count', 'comment_count',
+    'post_image', 'post_image_variants',
+)
+
+
+def archive_after_days():
+    return getattr(settings, 'ARCHIVE_AFTER_DAYS', 365)
+
+
+def cutoff(days=None):
+    return timezone.now() - timedelta(days=archive_after_days() if days is None else days)
+
+
+def archivable(before):
+    # Reviewed posts only: the moderation queue is never archived
+    return Post.objects.filter(last_activity_at__lt=before).filter(Q(moderated=True) | Q(rejected=True))
+
+
+def next_batch(before, after_id, limit):
+    """Ids of the next ``limit`` archivable posts past ``after_id``, walking the primary key."""
+    return list(archivable(before).filter(pk__gt=after_id).order_by('pk').values_list('pk', flat=True)[:limit])
+
+
+def archive_posts(post_ids, before):
+    """Move the posts among ``post_ids`` that are still archivable; return (posts, comments) moved."""
+    with transaction.atomic():
+        posts = archivable(before).filter(pk__in=post_ids)
+        if connection.features.has_select_for_update:
+            # New comments and likes on these posts wait for this batch
+            posts = posts.select_for_update()
+        rows = list(posts.values(
+            'pk', 'author_id', 'moderated', 'create_date', 'last_activity_at', 'updated_at', *ARCHIVED_FIELDS,
+        ))
+        if not rows:
+            return 0, 0
+        ids = [row['pk'] for row in rows]
+        ArchivedPost.objects.bulk_create([
+            ArchivedPost(
+                id=row['pk'], author_id=row['author_id'], moderated=row['moderated'],
+                create_date=row['create_date'], last_activity_at=row['last_activity_at'],
+                updated_at=row['updated_at'], data={name: row[name] for name in ARCHIVED_FIELDS},
+            )
+            for row in rows
+        ])
+        comments = Comment.objects.filter(post_id__in=ids)
+        archived_comments = ArchivedComment.objects.bulk_create(
+            ArchivedComment(id=pk, post_id=post_id, author_id=author_id, content=content, create_date=create_date)
+            for pk, post_id, author_id, content, create_date in comments.values_list(
+                'pk', 'post_id', 'author_id', 'content', 'create_date'
+            ).iterator()
+        )
+        PostLike.objects.filter(post_id__in=ids).delete()
+        TimelineEntry.objects.filter(post_id__in=ids).delete()
+        # _raw_delete skips the per-row delete signals on purpose: the image
+        # is still referenced by the archived row, the cache is invalidated
+        # once below instead of once per comment, and the post's comment
+        # counters are kept as they were rather than counted down to zero.
+        comments._raw_delete(comments.db)
+        live = Post.objects.filter(pk__in=ids)
+        live._raw_delete(live.db)
+        cache.invalidate_posts(ids, feed=True)
+        cache.invalidate_activity_feed()
+    return len(rows), len(archived_comments)
+
+
+def archived_post(post_id):
+    """An unsaved Post rebuilt from the archive, if it was public, else None."""
+    archived = ArchivedPost.objects.select_related('author').filter(pk=post_id, moderated=True).first()
+    if archived is None:
+        return None
+    post = Post(
+        id=archived.pk, author=archived.author, moderated=archived.moderated,
+        create_date=archived.create_date, last_activity_at=archived.last_activity_at,
+        updated_at=archived.updated_at, **archived.data,
+    )
+    # Loaded here so serializing makes no queries, which async callers need
+    post.moderator = User.objects.filter(pk=post.moderator_id).first() if post.moderator_id else None
+    return post
+
+
+def archived_comments(post_id):
+    """The comments of an archived public post, or None if there is no such post."""
+    if not ArchivedPost.objects.filter(pk=post_id, moderated=True).exists():
+        return None
+    return ArchivedComment.objects.filter(post_id=post_id)
+
+
+def archived_comment(comment_id):
+    return ArchivedComment.objects.select_related('author').filter(pk=comment_id, post__moderated=True).first()
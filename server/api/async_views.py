@@ -0,0 +1,214 @@
+"""
+Async read paths for the ASGI deployment.
+
+Under ASGI (``server/asgi.py`` turns on ``ASYNC_READ_VIEWS``), GET requests
+for the post list/detail, comment lists and ``users/me`` are served by the
+coroutines below using the async ORM, so a request waiting on the database
+doesn't hold a worker thread. Every other method on those URLs is handed to
+the regular DRF viewset, and all other URLs are untouched.
+
+The payloads match the DRF views. These paths skip the response cache and
+ETag handling, which run synchronous cache and database calls.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import path, re_path
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed, NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.request import Request
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from . import archive, events
+from .authentication import ClaimsJWTAuthentication, ClaimsUser, atoken_version, check_token_version
+from .fieldsets import shape_queryset
+from .models import Post, Comment
+from .pagination import CommentPagination, post_pagination
+from .renderers import FastJSONRenderer, MessagePackRenderer
+from .serializers import UserSerializer, PostSerializer, CommentSerializer
+from .views import PostViewSet, CommentViewSet, UserViewSet, with_is_liked
+
+User = get_user_model()
+
+renderer = FastJSONRenderer()
+renderers = [renderer, MessagePackRenderer()]
+
+
+def render(data, status_code=status.HTTP_200_OK, request=None):
+    """Render for a DRF ``request``, negotiating the format, or as plain JSON."""
+    if request is None:
+        return HttpResponse(renderer.render(data), status=status_code, content_type='application/json')
+    try:
+        chosen, media_type = DefaultContentNegotiation().select_renderer(request, renderers)
+    except NotAcceptable:
+        chosen, media_type = renderer, renderer.media_type
+    response = HttpResponse(status=status_code, content_type=media_type)
+    response.content = chosen.render(data, media_type, {'request': request, 'response': response})
+    return response
+
+
+async def authenticate(request):
+    """Async equivalent of ClaimsJWTAuthentication.authenticate; returns a DRF Request."""
+    auth = ClaimsJWTAuthentication()
+    drf_request = Request(request, authenticators=())
+    drf_request.user = AnonymousUser()
+    header = auth.get_header(request)
+    raw_token = auth.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return drf_request
+    validated_token = auth.get_validated_token(raw_token)
+    if jwt_settings.USER_ID_CLAIM not in validated_token:
+        raise InvalidToken('Token contained no recognizable user identification')
+    user = ClaimsUser(validated_token)
+    check_token_version(validated_token, await atoken_version(user.pk))
+    drf_request.user = user
+    return drf_request
+
+
+def async_read(handler, sync_view):
+    """Serve GET/HEAD with ``handler`` and every other method with ``sync_view``."""
+    view_cls, actions = sync_view.cls, sync_view.actions
+    sync_view = sync_to_async(sync_view)
+
+    async def view(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return await sync_view(request, *args, **kwargs)
+        try:
+            drf_request = await authenticate(request)
+        except (AuthenticationFailed, InvalidToken, TokenError) as exc:
+            detail = getattr(exc, 'detail', str(exc))
+            return render({'detail': detail}, status.HTTP_401_UNAUTHORIZED)
+        return await handler(drf_request, *args, **kwargs)
+
+    view = csrf_exempt(view)
+    # Reported by api.metrics, and routed by api.replicas, like the sync viewsets
+    view.cls, view.actions = view_cls, actions
+    return view
+
+
+def not_found(model):
+    return render({'detail': f'No {model._meta.object_name} matches the given query.'}, status.HTTP_404_NOT_FOUND)
+
+
+def visible_posts(request):
+    return with_is_liked(
+        shape_queryset(Post.objects.filter(moderated=True), PostSerializer, request), request.user
+    )
+
+
+async def post_list(request):
+    paginator = post_pagination(request)
+    posts = await paginator.apaginate_queryset(visible_posts(request), request)
+    data = PostSerializer(posts, many=True, context={'request': request}).data
+    return render(paginator.get_paginated_response(data).data, request=request)
+
+
+async def post_detail(request, pk):
+    post = await visible_posts(request).filter(pk=pk).afirst()
+    if post is None:
+        post = await sync_to_async(archive.archived_post)(pk)
+    if post is None:
+        return not_found(Post)
+    return render(PostSerializer(post, context={'request': request}).data, request=request)
+
+
+async def comment_page(request, queryset):
+    paginator = CommentPagination()
+    comments = await paginator.apaginate_queryset(shape_queryset(queryset, CommentSerializer, request), request)
+    data = CommentSerializer(comments, many=True, context={'request': request}).data
+    return render(paginator.get_paginated_response(data).data, request=request)
+
+
+async def post_comments(request, pk):
+    if await Post.objects.filter(pk=pk, moderated=True).aexists():
+        return await comment_page(request, Comment.objects.filter(post_id=pk))
+    queryset = await sync_to_async(archive.archived_comments)(pk)
+    if queryset is None:
+        return not_found(Post)
+    return await comment_page(request, queryset)
+
+
+async def comment_list(request):
+    queryset = Comment.objects.all()
+    post_id = request.query_params.get('post')
+    if post_id is not None:
+        if not post_id.isdigit():
+            return render({'detail': 'post must be a post id'}, status.HTTP_400_BAD_REQUEST)
+        queryset = queryset.filter(post_id=post_id)
+    return await comment_page(request, queryset)
+
+
+async def me(request):
+    if not request.user.is_authenticated:
+        return render({'detail': 'Authentication credentials were not provided.'}, status.HTTP_401_UNAUTHORIZED)
+    user = await shape_queryset(User.objects.filter(pk=request.user.pk), UserSerializer, request).afirst()
+    if user is None:
+        return not_found(User)
+    return render(UserSerializer(user, context={'request': request}).data, request=request)
+
+
+def parse_ids(value):
+    try:
+        return {int(part) for part in value.split(',') if part}
+    except ValueError:
+        return None
+
+
+async def event_stream(request):
+    """
+    Server-sent events for ``?feed=1`` (newly approved posts) and
+    ``?posts=1,2`` (comments and like counts on those posts).
+    """
+    if not isinstance(request, ASGIRequest):
+        # A held-open response would tie up a WSGI worker thread
+        return render({'detail': 'Event streams need the ASGI server.'}, status.HTTP_501_NOT_IMPLEMENTED)
+    post_ids = parse_ids(request.GET.get('posts', ''))
+    max_posts = getattr(settings, 'EVENT_MAX_POSTS', 50)
+    if post_ids is None or len(post_ids) > max_posts:
+        return render({'detail': f'posts must be at most {max_posts} comma-separated ids'}, status.HTTP_400_BAD_REQUEST)
+    channels = [
+        events.post_channel(post_id)
+        async for post_id in Post.objects.filter(pk__in=post_ids, moderated=True).values_list('pk', flat=True)
+    ]
+    if request.GET.get('feed') == '1':
+        channels.append(events.FEED_CHANNEL)
+    if not channels:
+        return render({'detail': 'Nothing to subscribe to'}, status.HTTP_400_BAD_REQUEST)
+
+    broker = events.broker()
+    subscription = broker.subscribe(channels)
+
+    async def frames():
+        try:
+            async for frame in events.stream(
+                subscription,
+                getattr(settings, 'LIKE_EVENT_INTERVAL', 1.0),
+                getattr(settings, 'EVENT_HEARTBEAT_SECONDS', 15),
+            ):
+                yield frame
+        finally:
+            # Runs when the client disconnects and the response is cancelled
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(frames(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx would otherwise buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+urlpatterns = [
+    path('posts/', async_read(post_list, PostViewSet.as_view({'get': 'list', 'post': 'create'}))),
+    re_path(r'^posts/(?P<pk>\d+)/$', async_read(post_detail, PostViewSet.as_view({
+        'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy',
+    }))),
+    re_path(r'^posts/(?P<pk>\d+)/comments/$', async_read(post_comments, PostViewSet.as_view({'get': 'comments'}))),
+    path('comments/', async_read(comment_list, CommentViewSet.as_view({'get': 'list', 'post': 'create'}))),
+    path('users/me/', async_read(me, UserViewSet.as_view({'get': 'me'}))),
+]
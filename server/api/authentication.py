@@ -0,0 +1,166 @@
+"""
+Stateless JWT authentication.
+
+Access tokens carry the claims that permission checks need: role,
+is_staff, is_superuser and group names. ``ClaimsUser`` answers those from
+the token without touching the database. Any other attribute loads the
+User row, once, the first time a view asks for it.
+
+Each token also holds the user's ``token_version``. Changing a user's
+role, staff flags, active flag, password or groups bumps the version
+(see ``User.save`` and ``api.signals``), and tokens minted before the
+change are rejected. The current version is read from the cache, so an
+authenticated request costs no query once the cache is warm.
+
+A change only drops the cached version from the cache of the process
+that made it. With a per-process cache (LocMem) the other workers, and
+every worker after a change from a shell or management command, find out
+when their copy expires: TOKEN_VERSION_CACHE_SECONDS bounds how long a
+revoked token keeps working. With a shared cache it can be much longer.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.functional import cached_property
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+User = get_user_model()
+
+
+def user_claims(user):
+    return {
+        'role': user.role,
+        'is_staff': user.is_staff,
+        'is_superuser': user.is_superuser,
+        'groups': sorted(user.groups.values_list('name', flat=True)),
+        'ver': user.token_version,
+    }
+
+
+def _version_key(user_id):
+    return f'token_version:{user_id}'
+
+
+def version_cache_seconds():
+    return getattr(settings, 'TOKEN_VERSION_CACHE_SECONDS', 30)
+
+
+def token_version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = User.objects.filter(pk=user_id, is_active=True).values_list(
+            'token_version', flat=True
+        ).first()
+        if version is not None:
+            cache.set(key, version, version_cache_seconds())
+    return version
+
+
+async def atoken_version(user_id):
+    key = _version_key(user_id)
+    version = await cache.aget(key)
+    if version is None:
+        version = await User.objects.filter(pk=user_id, is_active=True).values_list(
+            'token_version', flat=True
+        ).afirst()
+        if version is not None:
+            await cache.aset(key, version, version_cache_seconds())
+    return version
+
+
+def forget_token_versions(user_ids):
+    keys = [_version_key(user_id) for user_id in user_ids]
+
+    # Drop now, and again after commit in case a request re-cached the old
+    # version before the new one was visible.
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class ClaimsRefreshToken(RefreshToken):
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for claim, value in user_claims(user).items():
+            token[claim] = value
+        return token
+
+
+class ClaimsUser(TokenUser):
+    """request.user under JWT auth; see the module docstring."""
+
+    @cached_property
+    def instance(self):
+        return User.objects.get(pk=self.pk)
+
+    @property
+    def role(self):
+        return self.token.get('role', 'author')
+
+    @cached_property
+    def group_names(self):
+        return frozenset(self.token.get('groups', ()))
+
+    @property
+    def is_active(self):
+        # Deactivating a user revokes their tokens
+        return True
+
+    @property
+    def username(self):
+        return self.instance.username
+
+    @property
+    def groups(self):
+        return self.instance.groups
+
+    @property
+    def user_permissions(self):
+        return self.instance.user_permissions
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.instance, name)
+
+
+def user_instance(user):
+    """The User row behind ``request.user``."""
+    return user.instance if isinstance(user, ClaimsUser) else user
+
+
+def check_token_version(validated_token, current):
+    if current is None or validated_token.get('ver') != current:
+        raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+
+
+class ClaimsJWTAuthentication(JWTStatelessUserAuthentication):
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        check_token_version(validated_token, token_version(user.pk))
+        return user
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = ClaimsRefreshToken
+
+    def validate(self, attrs):
+        # The copied claims are only current while the version still matches
+        refresh = self.token_class(attrs['refresh'])
+        user_id = refresh.payload.get(jwt_settings.USER_ID_CLAIM)
+        if user_id is None:
+            raise InvalidToken('Token contained no recognizable user identification')
+        check_token_version(refresh, token_version(user_id))
+        return super().validate(attrs)
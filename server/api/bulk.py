@@ -0,0 +1,83 @@
+"""
+Batched creates for posts and comments.
+
+A bulk request is a JSON list of objects, each shaped like the body of
+the matching single create. Every item is validated with the normal
+serializer. If any item fails, nothing is written and the response lists
+the errors by position, with ``{}`` for the items that passed. Otherwise
+all items are inserted with one ``bulk_create`` in one transaction.
+
+``bulk_create`` skips ``save()`` and the model signals, so the work those
+would do is done here: ``last_activity_at`` and timeline fan-out for
+posts, the post counters for comments, and cache invalidation for both.
+Moderated posts are also announced on the event stream (api/events.py).
+Search stays current through the FTS triggers (api/search.py).
+"""
+from django.conf import settings
+from django.db import transaction
+
+from . import cache, events, timelines
+from .models import Post, Comment
+
+
+def max_items():
+    return getattr(settings, 'BULK_CREATE_MAX_ITEMS', 100)
+
+
+def validate(serializer_class, items, context):
+    """Return (validated_data per item, errors per item, any_invalid)."""
+    validated, errors = [], []
+    for item in items:
+        if not isinstance(item, dict):
+            validated.append(None)
+            errors.append({'non_field_errors': ['Expected an object.']})
+            continue
+        serializer = serializer_class(data=item, context=context)
+        if serializer.is_valid():
+            validated.append(serializer.validated_data)
+            errors.append({})
+        else:
+            validated.append(None)
+            errors.append(serializer.errors)
+    return validated, errors, any(errors)
+
+
+def preload_posts(items):
+    """Fetch every post the items refer to in one query, keyed by pk."""
+    post_ids = set()
+    for item in items:
+        if isinstance(item, dict):
+            try:
+                post_ids.add(int(item.get('post')))
+            except (TypeError, ValueError):
+                pass
+    return Post.objects.only('id').in_bulk(post_ids)
+
+
+def create_posts(author, validated):
+    posts = []
+    for data in validated:
+        post = Post(author=author, **data)
+        # Post.save would do this
+        post.last_activity_at = post.create_date
+        posts.append(post)
+    with transaction.atomic():
+        Post.objects.bulk_create(posts)
+        cache.invalidate_posts(
+            [post.pk for post in posts], feed=any(post.moderated for post in posts)
+        )
+        timelines.fan_out([post.pk for post in posts if post.moderated])
+        events.posts_published([post.pk for post in posts if post.moderated])
+    return posts
+
+
+def create_comments(author, validated):
+    comments = [Comment(author=author, **data) for data in validated]
+    added = {}
+    for comment in comments:
+        count, latest = added.get(comment.post_id, (0, comment.create_date))
+        added[comment.post_id] = (count + 1, max(latest, comment.create_date))
+    with transaction.atomic():
+        Comment.objects.bulk_create(comments)
+        Post.comments_added(added)
+    return comments
@@ -0,0 +1,221 @@
+"""
+Read-through cache for the public feed and post detail payloads.
+
+Entries are keyed by version tokens rather than deleted on write: a post
+write replaces that post's token, and a change to what the feed contains
+or how it is ordered replaces the feed token. Old keys are never read
+again and simply age out of the backend.
+
+Each entry carries a soft expiry. Once it passes, one worker takes a short
+lock and rebuilds while everyone else keeps serving the stale value.
+"""
+import hashlib
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import metrics
+
+FEED_VERSION_KEY = 'feed:version'
+# Comments reorder the activity-sorted feed without touching the default one
+ACTIVITY_VERSION_KEY = 'feed:activity:version'
+# When the feed token was last replaced, for Last-Modified: removing a post
+# changes the feed without touching any row left on the page
+FEED_CHANGED_KEY = 'feed:changed_at'
+STATS_KEYS = ('hits', 'stale_hits', 'misses')
+
+
+def _timeout():
+    return getattr(settings, 'API_CACHE_TIMEOUT', 60)
+
+
+def _stale_timeout():
+    return getattr(settings, 'API_CACHE_STALE_TIMEOUT', 300)
+
+
+def _lock_timeout():
+    return getattr(settings, 'API_CACHE_LOCK_TIMEOUT', 10)
+
+
+def _post_version_key(post_id):
+    return f'post:{post_id}:version'
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # A fresh random token means an evicted version can never resurrect
+        # payloads that were cached under an older one.
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def _bump(*keys):
+    def replace():
+        values = {key: uuid.uuid4().hex for key in keys}
+        if FEED_VERSION_KEY in keys:
+            values[FEED_CHANGED_KEY] = time.time()
+        cache.set_many(values, None)
+
+    # Bump now so this transaction reads its own writes, and again after
+    # commit so a reader that rebuilt from pre-commit data is discarded.
+    replace()
+    transaction.on_commit(replace)
+
+
+def invalidate_post(post_id, feed=False):
+    invalidate_posts([post_id], feed=feed)
+
+
+def invalidate_posts(post_ids, feed=False):
+    keys = [_post_version_key(post_id) for post_id in post_ids]
+    if feed:
+        keys.append(FEED_VERSION_KEY)
+    _bump(*keys)
+
+
+def invalidate_user_posts(user_id):
+    """Invalidate every post that embeds ``user_id`` as its author or moderator."""
+    from django.db.models import Q
+    from .models import Post
+
+    post_ids = Post.objects.filter(Q(author_id=user_id) | Q(moderator_id=user_id)).values_list('pk', flat=True)
+    invalidate_posts(list(post_ids), feed=True)
+
+
+def invalidate_feed():
+    _bump(FEED_VERSION_KEY)
+
+
+def feed_changed_at():
+    stamp = cache.get(FEED_CHANGED_KEY)
+    return datetime.fromtimestamp(stamp, timezone.utc) if stamp is not None else None
+
+
+def invalidate_activity_feed():
+    _bump(ACTIVITY_VERSION_KEY)
+
+
+def record(stat, amount=1):
+    metrics.count_cache(stat, amount)
+    key = f'cache_stats:{stat}'
+    if not cache.add(key, amount, None):
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            cache.set(key, amount, None)
+
+
+def get_stats():
+    values = cache.get_many([f'cache_stats:{stat}' for stat in STATS_KEYS])
+    return {stat: values.get(f'cache_stats:{stat}', 0) for stat in STATS_KEYS}
+
+
+def reset_stats():
+    cache.delete_many([f'cache_stats:{stat}' for stat in STATS_KEYS])
+
+
+def get_or_build(key, build):
+    """Return the cached value for ``key``, rebuilding it at most once at a time."""
+    entry = cache.get(key)
+    lock_key = f'{key}:lock'
+    # Marks the lock as ours, so only the call that took it releases it
+    token = uuid.uuid4().hex
+    locked = False
+    if entry is not None:
+        fresh_until, value = entry
+        if time.time() < fresh_until:
+            record('hits')
+            return value
+        if not cache.add(lock_key, token, _lock_timeout()):
+            record('stale_hits')
+            return value
+        locked = True
+    elif cache.add(lock_key, token, _lock_timeout()):
+        locked = True
+    else:
+        # Someone else is building a cold key; give them a moment
+        for _ in range(20):
+            time.sleep(0.01)
+            entry = cache.get(key)
+            if entry is not None:
+                record('hits')
+                return entry[1]
+
+    record('misses')
+    try:
+        value = build()
+        store(key, value)
+    finally:
+        if locked and cache.get(lock_key) == token:
+            cache.delete(lock_key)
+    return value
+
+
+def store(key, value):
+    cache.set(key, (time.time() + _timeout(), value), _timeout() + _stale_timeout())
+
+
+def store_many(values):
+    fresh_until = time.time() + _timeout()
+    cache.set_many(
+        {key: (fresh_until, value) for key, value in values.items()},
+        _timeout() + _stale_timeout(),
+    )
+
+
+def feed_page_key(request, activity=False, versions=None):
+    # The full path carries cursor, page_size and any other query options;
+    # versions, the rows the validators saw, if the caller has them
+    raw = f'{request.get_host()}{request.get_full_path()}'
+    if versions is not None:
+        raw += repr(list(versions.items()))
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    version = _get_version(FEED_VERSION_KEY)
+    if activity:
+        version = f'{version}:{_get_version(ACTIVITY_VERSION_KEY)}'
+    return f'feed:{version}:page:{digest}'
+
+
+def post_payload_keys(post_ids, row_versions=None):
+    """Payload keys, also tied to ``row_versions`` ({id: updated_at}) where given."""
+    version_keys = {post_id: _post_version_key(post_id) for post_id in post_ids}
+    versions = cache.get_many(version_keys.values())
+    row_versions = row_versions or {}
+    keys = {}
+    for post_id, version_key in version_keys.items():
+        version = versions.get(version_key) or _get_version(version_key)
+        keys[post_id] = f'post:{post_id}:{version}'
+        if row_versions.get(post_id):
+            keys[post_id] += ':' + hashlib.md5(row_versions[post_id].encode()).hexdigest()
+    return keys
+
+
+def get_post_payloads(post_ids, row_versions=None):
+    """Return ({id: payload} for fresh entries, [ids that need rebuilding])."""
+    keys = post_payload_keys(post_ids, row_versions)
+    entries = cache.get_many(keys.values())
+    now = time.time()
+    found, missing = {}, []
+    for post_id, key in keys.items():
+        entry = entries.get(key)
+        if entry is not None and now < entry[0]:
+            found[post_id] = entry[1]
+        else:
+            missing.append(post_id)
+    if found:
+        record('hits', len(found))
+    if missing:
+        record('misses', len(missing))
+    return found, missing
+
+
+def set_post_payloads(payloads, row_versions=None):
+    keys = post_payload_keys(payloads, row_versions)
+    store_many({keys[post_id]: payload for post_id, payload in payloads.items()})
@@ -0,0 +1,97 @@
+"""
+Brotli or gzip for API responses, whichever the client prefers in
+Accept-Encoding, with brotli winning a tie.
+
+Only complete (non-streaming) responses of COMPRESSIBLE_TYPES at least
+COMPRESSION_MIN_BYTES long are compressed. Streams, including the event
+stream, and media files go out as they are. Brotli runs at a low quality
+level by default: for dynamic payloads the last few percent of size cost
+far more CPU than they save.
+
+A compressed response keeps a strong ETag with the coding appended
+(``"<tag>-br"``), so each encoding has its own validator. The suffix is
+taken off If-Match and If-None-Match on the way in, so the views' checks,
+including the If-Match write guard, see the tag they issued.
+"""
+import gzip
+import re
+
+import brotli
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+COMPRESSIBLE_TYPES = {'application/json', 'application/msgpack', 'text/html', 'text/plain'}
+CODINGS = ('br', 'gzip')
+CODING_SUFFIX = re.compile(r'-(%s)"' % '|'.join(CODINGS))
+
+
+def min_bytes():
+    return getattr(settings, 'COMPRESSION_MIN_BYTES', 1024)
+
+
+def accepted_coding(header):
+    """The coding in CODINGS with the highest q-value in ``header``, or None."""
+    weights = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                continue
+        weights[coding.strip().lower()] = weight
+    default = weights.get('*', 0)
+    best = max(CODINGS, key=lambda coding: weights.get(coding, default))
+    return best if weights.get(best, default) > 0 else None
+
+
+def compress(content, coding):
+    if coding == 'br':
+        return brotli.compress(content, quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 4))
+    return gzip.compress(content, compresslevel=getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6), mtime=0)
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    def process_request(self, request):
+        request.etag_codings = set()
+        for name in ('HTTP_IF_MATCH', 'HTTP_IF_NONE_MATCH'):
+            if name in request.META:
+                request.etag_codings.update(CODING_SUFFIX.findall(request.META[name]))
+                request.META[name] = CODING_SUFFIX.sub('"', request.META[name])
+
+    def process_response(self, request, response):
+        if response.status_code == 304:
+            # Answer with the tag the client holds
+            codings = getattr(request, 'etag_codings', ())
+            if len(codings) == 1:
+                self.tag_coding(response, codings.pop())
+            return response
+        if response.streaming or response.has_header('Content-Encoding') or response.status_code == 206:
+            return response
+        content_type = response.get('Content-Type', '').partition(';')[0].strip()
+        if content_type not in COMPRESSIBLE_TYPES:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < min_bytes():
+            return response
+        coding = accepted_coding(request.headers.get('Accept-Encoding', ''))
+        if coding is None:
+            return response
+        compressed = compress(response.content, coding)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = coding
+        self.tag_coding(response, coding)
+        return response
+
+    @staticmethod
+    def tag_coding(response, coding):
+        # The bytes differ from the uncompressed representation's
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = f'{etag[:-1]}-{coding}"'
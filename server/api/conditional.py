@@ -0,0 +1,148 @@
+"""
+ETag / Last-Modified functions for ``django.views.decorators.http.condition``.
+
+They look only at ``updated_at`` columns (and ids), so a poll whose
+validators still match gets a 304 without any serialization. The viewer's
+id is folded into each ETag because payloads carry per-viewer fields such
+as ``is_liked``, and so is the negotiated media type.
+
+The feed and post detail views also key their cached payloads by the
+versions found here (``post_list_versions``, ``post_detail_version``).
+Each worker has its own cache, so a worker that missed an invalidation
+could otherwise pair a fresh ETag with a stale body.
+"""
+import hashlib
+
+from . import archive, cache
+from .models import Post, Comment
+from .pagination import CommentPagination, post_pagination
+
+
+def _viewer(request):
+    return request.user.pk if request.user.is_authenticated else 'anon'
+
+
+def _etag(request, *parts):
+    # The negotiated format too: JSON and MessagePack bodies of the same
+    # resource must not validate each other
+    parts = (_viewer(request), getattr(request, 'accepted_media_type', None), *parts)
+    return '"%s"' % hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def _state(request, key, compute):
+    # condition() asks for the ETag and Last-Modified separately; compute
+    # both from one query and remember them on the request.
+    cached = getattr(request, '_conditional_state', {})
+    if key not in cached:
+        cached[key] = compute()
+        request._conditional_state = cached
+    return cached[key]
+
+
+def _page_state(request, paginator, queryset, related, changed_at=None, stamp='updated_at'):
+    # Walk the same page the view will serve, loading only timestamps
+    fields = ['id', stamp, *(field.lstrip('-') for field in paginator.ordering)]
+    fields += [f'{name}__updated_at' for name in related]
+    rows = paginator.paginate_queryset(
+        queryset.select_related(*related).only(*fields), request
+    )
+    # The newest timestamp behind each row, in page order
+    versions = {}
+    for row in rows:
+        row_stamps = [getattr(row, stamp)]
+        for name in related:
+            obj = getattr(row, name)
+            if obj is not None:
+                row_stamps.append(obj.updated_at)
+        versions[row.pk] = max(row_stamps)
+    stamps = list(versions.values())
+    tag = _etag(
+        request, request.get_full_path(),
+        [(row.pk, getattr(row, stamp).isoformat()) for row in rows],
+        max(stamps).isoformat() if stamps else None,
+    )
+    # Rows that left the page carry no timestamp; changed_at covers them
+    if changed_at is not None:
+        stamps.append(changed_at)
+    return tag, max(stamps) if stamps else None, {pk: value.isoformat() for pk, value in versions.items()}
+
+
+def _post_list_state(request):
+    return _state(request, 'post_list', lambda: _page_state(
+        request, post_pagination(request), Post.objects.filter(moderated=True), ('author', 'moderator'),
+        changed_at=cache.feed_changed_at(),
+    ))
+
+
+def post_list_etag(request, *args, **kwargs):
+    return _post_list_state(request)[0]
+
+
+def post_list_last_modified(request, *args, **kwargs):
+    return _post_list_state(request)[1]
+
+
+def post_list_versions(request):
+    """{post id: version} for the page the validators were computed from."""
+    return _post_list_state(request)[2]
+
+
+def _post_detail_state(request, pk):
+    def compute():
+        try:
+            row = Post.objects.filter(pk=pk, moderated=True).values_list(
+                'updated_at', 'author__updated_at', 'moderator__updated_at'
+            ).first()
+        except ValueError:
+            row = None
+        if row is None:
+            return None, None, None
+        stamps = [stamp for stamp in row if stamp is not None]
+        return _etag(request, pk, [stamp.isoformat() for stamp in stamps]), max(stamps), max(stamps).isoformat()
+    return _state(request, ('post', pk), compute)
+
+
+def post_detail_etag(request, pk=None, *args, **kwargs):
+    return _post_detail_state(request, pk)[0]
+
+
+def post_detail_last_modified(request, pk=None, *args, **kwargs):
+    return _post_detail_state(request, pk)[1]
+
+
+def post_detail_version(request, pk):
+    return _post_detail_state(request, pk)[2]
+
+
+def _post_comments_state(request, pk):
+    def compute():
+        try:
+            state = _page_state(request, CommentPagination(), Comment.objects.filter(post_id=pk), ('author',))
+        except (TypeError, ValueError):
+            # Not a post id; the view answers 404
+            return None, None, None
+        if state[1] is None:
+            # No live comments here; the post may have been archived
+            archived = archive.archived_comments(pk)
+            if archived is not None:
+                # Archived comments are never edited
+                return _page_state(request, CommentPagination(), archived, ('author',), stamp='create_date')
+        return state
+    return _state(request, ('comments', pk), compute)
+
+
+def post_comments_etag(request, pk=None, *args, **kwargs):
+    return _post_comments_state(request, pk)[0]
+
+
+def post_comments_last_modified(request, pk=None, *args, **kwargs):
+    return _post_comments_state(request, pk)[1]
+
+
+def me_etag(request, *args, **kwargs):
+    user = request.user
+    return _etag(request, 'me', user.updated_at.isoformat())
+
+
+def me_last_modified(request, *args, **kwargs):
+    return request.user.updated_at
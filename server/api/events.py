@@ -0,0 +1,201 @@
+"""
+Publish/subscribe for the server-sent event stream (``GET /api/events/``).
+
+Write paths publish once their transaction commits:
+
+    feed, post:<id>  post.moderated   the post, once it enters the public feed
+    post:<id>        comment.created  the new comment
+    post:<id>        post.likes       the post's like_count after a change
+
+EVENT_BROKER names the broker class. LocalBroker delivers within this
+process only. RedisBroker relays through Redis pub/sub, so a write
+handled by one worker reaches the streams held open by every other
+worker. RedisBroker needs the ``redis`` package.
+
+Each subscriber has a bounded queue. A client that stops reading loses
+its oldest events, not the server's memory.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+FEED_CHANNEL = 'feed'
+# Events buffered per subscriber before the oldest are dropped
+QUEUE_SIZE = 100
+# How long a disconnected EventSource waits before reconnecting
+RETRY_MILLISECONDS = 3000
+
+
+def post_channel(post_id):
+    return f'post:{post_id}'
+
+
+class Subscription:
+    def __init__(self, channels, loop):
+        self.channels = tuple(channels)
+        self.loop = loop
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+
+    def put(self, event):
+        # Called from any thread; the queue belongs to the stream's loop
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:  # the loop has closed
+            pass
+
+    def _put(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout):
+        """The next event, or None after ``timeout`` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class LocalBroker:
+    def __init__(self, **options):
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)
+
+    def subscribe(self, channels):
+        subscription = Subscription(channels, asyncio.get_running_loop())
+        with self.lock:
+            for channel in subscription.channels:
+                self.subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                self.subscriptions[channel].discard(subscription)
+                if not self.subscriptions[channel]:
+                    del self.subscriptions[channel]
+
+    def publish(self, channel, event):
+        self.dispatch(channel, event)
+
+    def dispatch(self, channel, event):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(event)
+
+
+class RedisBroker(LocalBroker):
+    """Publishes to Redis; one listener thread per process feeds the local subscribers."""
+    prefix = 'api-events:'
+
+    def __init__(self, url=None, **options):
+        import redis
+        super().__init__()
+        self.redis = redis.Redis.from_url(url)
+        self.listener = None
+
+    def subscribe(self, channels):
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(target=self.listen, daemon=True)
+                self.listener.start()
+        return super().subscribe(channels)
+
+    def publish(self, channel, event):
+        # Delivered locally when it comes back from Redis, like everyone else's
+        self.redis.publish(self.prefix + channel, json.dumps(event))
+
+    def listen(self):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(self.prefix + '*')
+        for message in pubsub.listen():
+            channel = message['channel'].decode()[len(self.prefix):]
+            self.dispatch(channel, json.loads(message['data']))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            broker_class = import_string(getattr(settings, 'EVENT_BROKER', 'api.events.LocalBroker'))
+            _broker = broker_class(**getattr(settings, 'EVENT_BROKER_OPTIONS', {}))
+    return _broker
+
+
+def publish(channel, event_type, data):
+    """Send to subscribers of ``channel`` once the current transaction commits."""
+    event = {'type': event_type, 'data': data}
+    transaction.on_commit(lambda: broker().publish(channel, event))
+
+
+def posts_published(post_ids):
+    """Announce posts that just entered the public feed, serialized once committed."""
+    post_ids = list(post_ids)
+    if post_ids:
+        transaction.on_commit(lambda: _publish_posts(post_ids))
+
+
+def _publish_posts(post_ids):
+    # Imported here: models imports this module
+    from .models import Post
+    from .serializers import PostSerializer
+    posts = Post.objects.select_related('author', 'moderator').filter(pk__in=post_ids, moderated=True)
+    for payload in PostSerializer(posts, many=True).data:
+        payload.pop('is_liked', None)  # per user, so meaningless here
+        event = {'type': 'post.moderated', 'data': payload}
+        broker().publish(FEED_CHANNEL, event)
+        broker().publish(post_channel(payload['id']), event)
+
+
+def comment_created(payload):
+    publish(post_channel(payload['post']), 'comment.created', payload)
+
+
+def like_count_changed(post_id, like_count):
+    publish(post_channel(post_id), 'post.likes', {'id': post_id, 'like_count': like_count})
+
+
+def format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+async def stream(subscription, like_interval, heartbeat):
+    """
+    Yield ``subscription``'s events as SSE frames.
+
+    Like counts are debounced per post: the first change goes out at once,
+    later ones within ``like_interval`` seconds are folded into the newest
+    count for that post. A comment line is sent after ``heartbeat`` idle
+    seconds so proxies keep the connection open.
+    """
+    loop = asyncio.get_running_loop()
+    likes = {}
+    next_flush = 0
+    yield f'retry: {RETRY_MILLISECONDS}\n\n'
+    while True:
+        timeout = max(next_flush - loop.time(), 0) if likes else heartbeat
+        event = await subscription.get(timeout)
+        if event is None and not likes:
+            yield ': ping\n\n'
+            continue
+        if event is not None:
+            if event['type'] == 'post.likes':
+                likes[event['data']['id']] = event
+            else:
+                yield format_event(event)
+        now = loop.time()
+        if likes and now >= next_flush:
+            for like_event in likes.values():
+                yield format_event(like_event)
+            likes.clear()
+            next_flush = now + like_interval
@@ -0,0 +1,136 @@
+"""
+Fast path for read serialization, switched on by FAST_SERIALIZATION.
+
+``compile_serializer`` turns a bound serializer into one function that
+builds a row's dict in a single comprehension. Every field gets a
+precompiled accessor:
+
+- plain columns are read with ``attrgetter``, and their DRF conversion is
+  skipped where it is the identity for that column type
+- ISO 8601 datetimes are converted with the time zone resolved once, not
+  per value
+- collapsed relations read the ``<name>_id`` column
+- nested serializers use their own compiled plan
+- method fields call the bound method
+- anything else calls ``get_attribute`` and ``to_representation`` the same
+  way ``Serializer.to_representation`` does
+
+The result is the same dict DRF would build, key for key. A field that
+raises ``SkipField`` sends that row back through DRF.
+"""
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import fields as drf_fields
+from rest_framework import ISO_8601, relations, serializers
+from rest_framework.fields import SkipField
+from rest_framework.settings import api_settings
+
+# DRF fields whose to_representation returns model values of the matching
+# column type unchanged
+IDENTITY_FIELDS = (
+    drf_fields.IntegerField, drf_fields.CharField, drf_fields.BooleanField,
+    drf_fields.ReadOnlyField,
+)
+
+
+def enabled():
+    return getattr(settings, 'FAST_SERIALIZATION', False)
+
+
+class Fallback(Exception):
+    pass
+
+
+def _identity(field):
+    if type(field) in IDENTITY_FIELDS or type(field) is drf_fields.EmailField:
+        return True
+    if type(field) is drf_fields.ChoiceField:
+        return all(isinstance(key, str) for key in field.choice_strings_to_values.values())
+    if type(field) is drf_fields.JSONField:
+        return not field.binary
+    return False
+
+
+def _simple_source(field):
+    return field.source != '*' and len(field.source_attrs) == 1
+
+
+def _datetime_accessor(field):
+    get, represent = attrgetter(field.source), field.to_representation
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    # DateTimeField.enforce_timezone looks the zone up on every value
+    zone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if zone is None or output_format is None or output_format.lower() != ISO_8601:
+        def read_datetime(instance):
+            value = get(instance)
+            return None if value is None else represent(value)
+        return read_datetime
+
+    def read_iso_datetime(instance):
+        value = get(instance)
+        if not value or isinstance(value, str) or value.utcoffset() is None:
+            return None if value is None else represent(value)
+        value = value.astimezone(zone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return read_iso_datetime
+
+
+def _accessor(serializer, field):
+    if isinstance(field, serializers.SerializerMethodField):
+        return getattr(serializer, field.method_name)
+
+    if isinstance(field, serializers.BaseSerializer) and not getattr(field, 'many', False) \
+            and _simple_source(field) and hasattr(field, 'fast_plan'):
+        get, nested = attrgetter(field.source), field.fast_plan()
+
+        def read_nested(instance):
+            value = get(instance)
+            return None if value is None else nested(value)
+        return read_nested
+
+    if isinstance(field, relations.PrimaryKeyRelatedField) and field.pk_field is None \
+            and type(field).to_representation is relations.PrimaryKeyRelatedField.to_representation \
+            and _simple_source(field):
+        model = serializer.Meta.model
+        try:
+            return attrgetter(model._meta.get_field(field.source).attname)
+        except FieldDoesNotExist:
+            pass
+
+    if _simple_source(field) and _identity(field):
+        return attrgetter(field.source)
+
+    if _simple_source(field) and isinstance(field, drf_fields.DateTimeField):
+        return _datetime_accessor(field)
+
+    if _simple_source(field) and isinstance(field, drf_fields.FileField):
+        get, represent = attrgetter(field.source), field.to_representation
+
+        def read_file(instance):
+            # An empty file renders as None without building a URL
+            value = get(instance)
+            return represent(value) if value else None
+        return read_file
+
+    def read_generic(instance):
+        try:
+            attribute = field.get_attribute(instance)
+        except SkipField:
+            raise Fallback
+        check_for_none = attribute.pk if isinstance(attribute, relations.PKOnlyObject) else attribute
+        return None if check_for_none is None else field.to_representation(attribute)
+    return read_generic
+
+
+def compile_serializer(serializer):
+    """Return ``instance -> dict`` equivalent to ``serializer.to_representation``."""
+    plan = tuple((field.field_name, _accessor(serializer, field)) for field in serializer._readable_fields)
+
+    def represent(instance):
+        try:
+            return {name: read(instance) for name, read in plan}
+        except Fallback:
+            return serializers.Serializer.to_representation(serializer, instance)
+    return represent
@@ -0,0 +1,142 @@
+"""
+Sparse fieldsets for GET requests.
+
+    ?fields=id,title,author.username   keep only these fields; a dotted name
+                                       selects inside a nested object
+    ?expand=author                     nest only these relations, and render
+                                       the others as their id
+
+Without ``expand`` every relation stays nested, as before. ``?expand=``
+with no value collapses them all. Names are relative to the serializer
+that produced the response, and unknown names are ignored.
+
+The same spec trims serializer output (``SparseFieldsMixin`` in
+api/serializers.py), narrows querysets with ``only()`` and
+``select_related()`` (``shape_queryset``), and trims payloads that are
+already cached in full (``FieldSpec.trim``).
+"""
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def _join(path, name):
+    return f'{path}.{name}' if path else name
+
+
+def _names(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class FieldSpec:
+    def __init__(self, fields=None, expand=None):
+        self.fields = set(fields) if fields else None
+        self.expand = set(expand) if expand is not None else None
+        if self.fields and self.expand is not None:
+            # Asking for author.username implies expanding author
+            for name in self.fields:
+                parts = name.split('.')
+                self.expand.update('.'.join(parts[:i]) for i in range(1, len(parts)))
+
+    @classmethod
+    def from_request(cls, request):
+        if request is None or request.method not in SAFE_METHODS:
+            return cls()
+        spec = getattr(request, '_field_spec', None)
+        if spec is None:
+            params = request.query_params
+            expand = params.get('expand')
+            spec = cls(_names(params.get('fields', '')), None if expand is None else _names(expand))
+            request._field_spec = spec
+        return spec
+
+    @property
+    def active(self):
+        return self.fields is not None or self.expand is not None
+
+    def selected(self, path):
+        """Field names to keep at ``path``, or None to keep them all."""
+        if self.fields is None:
+            return None
+        prefix = f'{path}.' if path else ''
+        names = {
+            name[len(prefix):].split('.')[0]
+            for name in self.fields if name.startswith(prefix) and len(name) > len(prefix)
+        }
+        # A bare relation name keeps all of that relation's fields
+        if path and not names:
+            return None
+        return names
+
+    def expanded(self, path):
+        return self.expand is None or path in self.expand
+
+    def trim(self, data, serializer_class, path=''):
+        """Apply the spec to a payload the full serializer already produced."""
+        if not self.active or data is None:
+            return data
+        keep = self.selected(path)
+        result = {}
+        for name, value in data.items():
+            if keep is not None and name not in keep:
+                continue
+            nested = serializer_class.expandable_fields.get(name)
+            if nested is not None and value is not None:
+                full = _join(path, name)
+                value = self.trim(value, nested, full) if self.expanded(full) else value['id']
+            result[name] = value
+        return result
+
+
+def _model_field(model, name):
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    return field if field.concrete and not field.many_to_many else None
+
+
+def _plan(serializer_class, spec, path, prefix):
+    model = serializer_class.Meta.model
+    keep = spec.selected(path)
+    columns, relations = [prefix + model._meta.pk.name], []
+    for name, field in serializer_class().fields.items():
+        if field.write_only or (keep is not None and name not in keep):
+            continue
+        nested = serializer_class.expandable_fields.get(name)
+        if nested is not None:
+            full = _join(path, name)
+            if spec.expanded(full):
+                relations.append(prefix + field.source)
+                nested_columns, nested_relations = _plan(nested, spec, full, f'{prefix}{field.source}__')
+                columns += nested_columns
+                relations += nested_relations
+            else:
+                columns.append(prefix + field.source)
+            continue
+        for source in serializer_class.column_sources.get(name, (field.source,)):
+            if _model_field(model, source) is not None:
+                columns.append(prefix + source)
+    return columns, relations
+
+
+@lru_cache(maxsize=256)
+def _cached_plan(serializer_class, fields, expand):
+    return _plan(serializer_class, FieldSpec(fields, expand), '', '')
+
+
+def shape_queryset(queryset, serializer_class, request):
+    """Load only what ``serializer_class`` will render for this request."""
+    spec = FieldSpec.from_request(request)
+    columns, relations = _cached_plan(
+        serializer_class,
+        frozenset(spec.fields) if spec.fields is not None else None,
+        frozenset(spec.expand) if spec.expand is not None else None,
+    )
+    if relations:
+        queryset = queryset.select_related(*relations)
+    if spec.active:
+        queryset = queryset.only(*columns)
+    return queryset
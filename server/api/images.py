@@ -0,0 +1,185 @@
+"""
+Background resizing of uploaded profile and post images.
+
+Uploads are saved as-is and the request returns straight away. Once the
+transaction commits, a worker thread writes re-encoded JPEG and WebP
+variants at a few sizes, with EXIF/GPS metadata dropped, and records
+their storage names on the row.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+from . import media
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels for each variant
+VARIANT_SIZES = {
+    'thumb': 150,
+    'medium': 800,
+    'large': 1600,
+}
+FORMATS = (('JPEG', 'jpg', ''), ('WEBP', 'webp', '_webp'))
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'IMAGE_WORKERS', 2),
+            thread_name_prefix='image-variants',
+        )
+    return _executor
+
+
+def schedule(model, pk, field_name):
+    """Build variants for ``field_name`` of the row once the current transaction commits."""
+    def submit():
+        if getattr(settings, 'IMAGE_PROCESS_SYNC', False):
+            process(model, pk, field_name)
+        else:
+            _get_executor().submit(_run_in_worker, model, pk, field_name)
+
+    transaction.on_commit(submit)
+
+
+def _run_in_worker(model, pk, field_name):
+    try:
+        process(model, pk, field_name)
+    except Exception:
+        logger.exception('Image processing failed for %s %s.%s', model.__name__, pk, field_name)
+    finally:
+        close_old_connections()
+
+
+def _variant_name(source_name, variant, suffix, ext):
+    directory, filename = os.path.split(source_name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, 'variants', f'{stem}_{variant}{suffix}.{ext}')
+
+
+def _encode(image, fmt):
+    buffer = BytesIO()
+    # No exif/icc arguments: the re-encoded file carries pixels only
+    if fmt == 'JPEG':
+        image.convert('RGB').save(buffer, fmt, quality=85, optimize=True, progressive=True)
+    else:
+        image.save(buffer, fmt, quality=80, method=4)
+    return ContentFile(buffer.getvalue())
+
+
+def build_variants(field_file):
+    with field_file.open('rb') as handle:
+        image = Image.open(handle)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+    variants = {}
+    for variant, edge in VARIANT_SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        for fmt, ext, suffix in FORMATS:
+            name = _variant_name(field_file.name, variant, suffix, ext)
+            variants[f'{variant}{suffix}'] = field_file.storage.save(name, _encode(resized, fmt))
+    return variants
+
+
+def process(model, pk, field_name):
+    instance = model.objects.filter(pk=pk).only('pk', field_name).first()
+    if instance is None:
+        return None
+    field_file = getattr(instance, field_name)
+    if not field_file:
+        return None
+    source_name = field_file.name
+    storage = field_file.storage
+
+    # The same file uploaded again reuses the variants built the first time
+    variants = media.known_variants(source_name, storage)
+    if variants is None:
+        variants = build_variants(field_file)
+        media.remember_variants(source_name, variants)
+
+    # Only record the variants if the image wasn't replaced in the meantime
+    changes = {f'{field_name}_variants': variants}
+    if hasattr(model, 'updated_at'):
+        changes['updated_at'] = timezone.now()
+    with transaction.atomic():
+        updated = model.objects.filter(pk=pk, **{field_name: source_name}).update(**changes)
+        if not updated:
+            # Unreferenced variants are left to collect_media
+            return None
+        # QuerySet.update() skips the signals that count references
+        media.retain(set(variants.values()))
+
+    from .cache import invalidate_post, invalidate_user_posts
+    if model._meta.model_name == 'post':
+        invalidate_post(pk)
+    else:
+        invalidate_user_posts(pk)
+    return variants
+
+
+def variant_urls(field_file, variants):
+    if not field_file or not variants:
+        return {}
+    return {name: field_file.storage.url(path) for name, path in variants.items()}
+
+
+class StreamingImageField(serializers.ImageField):
+    """
+    ImageField that validates from the uploaded file itself.
+
+    Django's ImageField copies the whole upload into memory before handing
+    it to Pillow. Here Pillow reads only the header from the (possibly
+    disk-spooled) upload to check format and dimensions.
+    """
+    default_error_messages = dict(
+        serializers.ImageField.default_error_messages,
+        too_large='Image files may not be larger than {max_size} MB.',
+        too_many_pixels='Images may not be larger than {max_pixels} megapixels.',
+    )
+
+    def to_internal_value(self, data):
+        file_object = serializers.FileField.to_internal_value(self, data)
+
+        max_bytes = getattr(settings, 'IMAGE_UPLOAD_MAX_BYTES', 20 * 1024 * 1024)
+        if file_object.size is not None and file_object.size > max_bytes:
+            self.fail('too_large', max_size=max_bytes // (1024 * 1024))
+
+        max_pixels = getattr(settings, 'IMAGE_UPLOAD_MAX_PIXELS', 40_000_000)
+        try:
+            if hasattr(file_object, 'temporary_file_path'):
+                source = file_object.temporary_file_path()
+            else:
+                source = file_object
+                file_object.seek(0)
+            with Image.open(source) as image:
+                width, height = image.size
+                image_format = image.format
+        except Exception:
+            self.fail('invalid_image')
+        finally:
+            if hasattr(file_object, 'seek') and callable(file_object.seek):
+                file_object.seek(0)
+
+        if image_format not in ALLOWED_FORMATS:
+            self.fail('invalid_image')
+        if width * height > max_pixels:
+            self.fail('too_many_pixels', max_pixels=max_pixels // 1_000_000)
+        file_object.content_type = Image.MIME.get(image_format)
+        return file_object
@@ -0,0 +1,146 @@
+"""
+Streaming input for ``manage.py import_users`` and ``import_posts``.
+
+Rows are read one at a time from JSON Lines or CSV and handed out in
+fixed-size batches, so memory use depends on the batch size and not on
+the size of the file.
+"""
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models
+from django.utils import timezone
+
+FORMATS = ('jsonl', 'csv')
+EXTENSIONS = {'.jsonl': 'jsonl', '.ndjson': 'jsonl', '.csv': 'csv'}
+# BooleanField.to_python only knows True/False/t/f/1/0
+BOOLEAN_STRINGS = {'true': True, 'yes': True, 'y': True, 'false': False, 'no': False, 'n': False}
+
+
+class RowError(Exception):
+    pass
+
+
+def guess_format(path):
+    for extension, fmt in EXTENSIONS.items():
+        if path.lower().endswith(extension):
+            return fmt
+    return None
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, dict) for each row of ``stream``."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield line_number, RowError(f'invalid JSON: {exc}')
+            continue
+        yield line_number, row if isinstance(row, dict) else RowError('expected a JSON object')
+
+
+def open_input(path):
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def clean_fields(model, row, names):
+    """
+    Convert the named columns of ``row`` with the model fields' own
+    validation. Empty values are left out so the field default applies.
+    """
+    values = {}
+    for name in names:
+        value = row.get(name)
+        if value is None or value == '':
+            continue
+        field = model._meta.get_field(name)
+        if isinstance(field, models.BooleanField) and isinstance(value, str):
+            value = BOOLEAN_STRINGS.get(value.strip().lower(), value)
+        try:
+            value = field.clean(value, None)
+        except ValidationError as exc:
+            raise RowError(f'{name}: {" ".join(exc.messages)}')
+        if isinstance(value, datetime) and timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        values[name] = value
+    return values
+
+
+class ImportCommand(BaseCommand):
+    """
+    Reads rows in batches and passes each batch of good rows to
+    ``import_batch`` as (line number, cleaned values) pairs. It returns
+    (created, skipped existing). Bad rows are
+    reported on stderr by line number and don't stop the import.
+    """
+    noun = 'rows'
+    # Problems printed individually before only counting the rest
+    max_reported_errors = 20
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSON Lines or CSV file, or - for stdin')
+        parser.add_argument('--format', dest='fmt', choices=FORMATS, help='default: from the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, path, fmt, batch_size, **options):
+        fmt = fmt or guess_format(path)
+        if fmt is None:
+            raise CommandError('Cannot tell the format from the file name; pass --format')
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+        self.errors = created = skipped = 0
+        with open_input(path) as stream:
+            for batch in batched(read_rows(stream, fmt), batch_size):
+                rows = []
+                for line_number, row in batch:
+                    try:
+                        if isinstance(row, RowError):
+                            raise row
+                        rows.append((line_number, self.clean_row(row)))
+                    except RowError as exc:
+                        self.report(line_number, exc)
+                if rows:
+                    batch_created, batch_skipped = self.import_batch(rows)
+                    created += batch_created
+                    skipped += batch_skipped
+        self.finish(created)
+        self.stdout.write(
+            f'Imported {created} {self.noun}, skipped {skipped} existing, {self.errors} invalid.'
+        )
+
+    def report(self, line_number, error):
+        self.errors += 1
+        if self.errors <= self.max_reported_errors:
+            self.stderr.write(f'line {line_number}: {error}')
+        elif self.errors == self.max_reported_errors + 1:
+            self.stderr.write('further errors are counted but not shown')
+
+    def clean_row(self, row):
+        raise NotImplementedError
+
+    def import_batch(self, rows):
+        raise NotImplementedError
+
+    def finish(self, created):
+        pass
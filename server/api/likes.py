@@ -0,0 +1,86 @@
+"""
+Coalescing of rapid like/unlike toggles, switched on by setting
+LIKE_COALESCE_SECONDS above zero.
+
+The first toggle of a (user, post) pair opens a window and schedules a
+flush in the worker that received it. Later toggles inside the window
+only overwrite the wanted state in the cache. When the window closes,
+the flush applies the last wanted state with a single ``add_like`` or
+``remove_like``. Responses report the state and count the client will
+see once that write lands.
+
+Toggles that reach different workers are merged only if the workers
+share the cache (REDIS_URL). With the per-process LocMem cache each
+worker opens its own window, and their flushes can land out of order.
+
+A flush that never runs, because its worker exits mid-window, drops the
+toggle. That is why this is opt-in.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from . import metrics
+from .models import Post, PostLike, User
+
+
+def window():
+    return getattr(settings, 'LIKE_COALESCE_SECONDS', 0)
+
+
+def _wanted_key(user_id, post_id):
+    return f'like:wanted:{user_id}:{post_id}'
+
+
+def _window_key(user_id, post_id):
+    return f'like:window:{user_id}:{post_id}'
+
+
+def schedule(delay, function, *args):
+    def run():
+        try:
+            function(*args)
+        finally:
+            # The timer thread opened its own connection
+            connection.close()
+
+    timer = threading.Timer(delay, run)
+    timer.daemon = True
+    timer.start()
+
+
+def toggle(post, user, liked):
+    """Like or unlike ``post``; return (is_liked, like_count) for the response."""
+    seconds = window()
+    if not seconds:
+        if liked:
+            post.add_like(user)
+        else:
+            post.remove_like(user)
+        return liked, post.like_count
+
+    # Outlive the window comfortably so a slow flush still finds them
+    cache.set(_wanted_key(user.pk, post.pk), liked, seconds * 10)
+    if cache.add(_window_key(user.pk, post.pk), 1, seconds * 10):
+        schedule(seconds, flush, user.pk, post.pk)
+    else:
+        metrics.registry.count('like_writes_coalesced')
+    persisted = PostLike.objects.filter(user_id=user.pk, post_id=post.pk).exists()
+    return liked, post.like_count + int(liked) - int(persisted)
+
+
+def flush(user_id, post_id):
+    # Close the window first: a toggle from here on opens a new one with
+    # its own flush, so none is lost between the read and the write.
+    cache.delete(_window_key(user_id, post_id))
+    liked = cache.get(_wanted_key(user_id, post_id))
+    post = Post.objects.filter(pk=post_id).first()
+    if liked is None or post is None:
+        return
+    user = User(pk=user_id)
+    if liked:
+        post.add_like(user)
+    else:
+        post.remove_like(user)
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import archive
+
+
+class Command(BaseCommand):
+    help = 'Move posts inactive for ARCHIVE_AFTER_DAYS, with their comments, into the archive tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='override ARCHIVE_AFTER_DAYS')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='seconds to sleep between batches, to leave room for other writers')
+        parser.add_argument('--limit', type=int, default=None, help='stop after this many posts')
+        parser.add_argument('--dry-run', action='store_true', help='count what would be archived')
+
+    def handle(self, *args, days, batch_size, pause, limit, dry_run, **options):
+        # Fixed for the whole run, so posts don't start qualifying midway
+        before = archive.cutoff(days)
+        if dry_run:
+            count = archive.archivable(before).count()
+            self.stdout.write(f'Would archive {min(count, limit) if limit else count} posts.')
+            return
+
+        posts = comments = 0
+        last_id = 0
+        while limit is None or posts < limit:
+            size = batch_size if limit is None else min(batch_size, limit - posts)
+            post_ids = archive.next_batch(before, last_id, size)
+            if not post_ids:
+                break
+            last_id = post_ids[-1]
+            moved_posts, moved_comments = archive.archive_posts(post_ids, before)
+            posts += moved_posts
+            comments += moved_comments
+            if pause:
+                time.sleep(pause)
+        self.stdout.write(f'Archived {posts} posts and {comments} comments.')
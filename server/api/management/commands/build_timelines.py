@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from api.models import Follow, TimelineEntry, User
+from api.timelines import backfill_posts, fanout_limit, latest_posts, write_entries
+
+
+class Command(BaseCommand):
+    help = (
+        'Recount followers and fill following-feed timelines from existing follows and posts. '
+        'Safe to re-run: entries that already exist are left alone.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='follows per batch')
+        parser.add_argument('--posts-per-author', type=int, default=None,
+                            help='default: TIMELINE_BACKFILL_POSTS')
+        parser.add_argument('--rebuild', action='store_true', help='empty every timeline first')
+
+    def handle(self, *args, batch_size, posts_per_author, rebuild, **options):
+        depth = backfill_posts() if posts_per_author is None else posts_per_author
+        followers = (
+            Follow.objects.filter(followee_id=OuterRef('pk')).order_by()
+            .values('followee_id').annotate(count=Count('pk')).values('count')
+        )
+        recounted = User.objects.update(follower_count=Coalesce(Subquery(followers), Value(0)))
+        if rebuild:
+            TimelineEntry.objects.all().delete()
+
+        limit = fanout_limit()
+        follows = written = 0
+        last_id = 0
+        while True:
+            # Walk by primary key so each batch is an index range scan
+            batch = list(
+                Follow.objects.filter(pk__gt=last_id, followee__follower_count__lt=limit)
+                .order_by('pk').values_list('pk', 'follower_id', 'followee_id')[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            follows += len(batch)
+            posts = {}
+            entries = []
+            for _, follower_id, followee_id in batch:
+                if followee_id not in posts:
+                    posts[followee_id] = latest_posts(followee_id, depth)
+                entries.extend(
+                    TimelineEntry(owner_id=follower_id, post_id=post_id, create_date=create_date)
+                    for post_id, create_date in posts[followee_id]
+                )
+            write_entries(entries)
+            written += len(entries)
+
+        self.stdout.write(
+            f'Recounted followers for {recounted} users; '
+            f'filled timelines from {follows} follows ({written} entries offered).'
+        )
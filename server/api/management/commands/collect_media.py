@@ -0,0 +1,44 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import media
+from api.models import ArchivedPost, MediaBlob, Post, User
+
+IMAGE_FIELDS = ((User, 'profile_image'), (Post, 'post_image'))
+
+
+class Command(BaseCommand):
+    help = 'Delete media files that no user or post has referenced for MEDIA_GC_GRACE_SECONDS.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-seconds', type=int, default=None)
+        parser.add_argument('--recount', action='store_true',
+                            help='recompute reference counts from the user, post and archived post tables first')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='report what would be deleted')
+
+    def handle(self, *args, grace_seconds, recount, batch_size, dry_run, **options):
+        if recount:
+            self.recount(batch_size, dry_run)
+        deleted, freed = media.collect(grace=grace_seconds, dry_run=dry_run)
+        verb = 'would delete' if dry_run else 'deleted'
+        self.stdout.write(f'{verb.capitalize()} {deleted} files ({freed} bytes).')
+
+    def recount(self, batch_size, dry_run):
+        counts = Counter()
+        for model, field_name in IMAGE_FIELDS:
+            rows = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            for name, variants in rows.values_list(field_name, f'{field_name}_variants').iterator(batch_size):
+                counts.update(media.stored_names(name, variants))
+        for data in ArchivedPost.objects.values_list('data', flat=True).iterator(batch_size):
+            counts.update(media.stored_names(data.get('post_image'), data.get('post_image_variants')))
+        self.stdout.write(f'{len(counts)} files referenced.')
+        if dry_run:
+            return
+        names = list(counts)
+        with transaction.atomic():
+            MediaBlob.objects.update(refs=0)
+            for start in range(0, len(names), batch_size):
+                media.retain(Counter({name: counts[name] for name in names[start:start + batch_size]}).elements())
@@ -0,0 +1,66 @@
+from django.db import transaction
+
+from api.cache import invalidate_feed
+from api.importing import ImportCommand, RowError, clean_fields
+from api.models import Post, User
+from api.timelines import fan_out
+
+FIELDS = ('title', 'content', 'create_date', 'moderated')
+
+
+class Command(ImportCommand):
+    help = (
+        'Create posts from JSON Lines or CSV without loading the file into memory. '
+        'Columns: title, content, author (a username), create_date (ISO 8601, '
+        'default now) and moderated (default false).'
+    )
+    noun = 'posts'
+    # username -> pk; cleared when full so memory stays bounded
+    author_cache_size = 10000
+
+    def handle(self, *args, **options):
+        self.author_ids = {}
+        self.feed_changed = False
+        super().handle(*args, **options)
+
+    def clean_row(self, row):
+        values = clean_fields(Post, row, FIELDS)
+        for name in ('title', 'content'):
+            if name not in values:
+                raise RowError(f'{name} is required')
+        if not row.get('author'):
+            raise RowError('author is required')
+        values['author'] = str(row['author'])
+        return values
+
+    def resolve_authors(self, usernames):
+        missing = {name for name in usernames if name not in self.author_ids}
+        if len(self.author_ids) + len(missing) > self.author_cache_size:
+            self.author_ids.clear()
+            missing = set(usernames)
+        self.author_ids.update(
+            User.objects.filter(username__in=missing).values_list('username', 'pk')
+        )
+
+    def import_batch(self, rows):
+        self.resolve_authors({values['author'] for _, values in rows})
+        posts = []
+        for line_number, values in rows:
+            author = values.pop('author')
+            author_id = self.author_ids.get(author)
+            if author_id is None:
+                self.report(line_number, f'no user named {author!r}')
+                continue
+            post = Post(author_id=author_id, **values)
+            # bulk_create skips Post.save, which would set this
+            post.last_activity_at = post.create_date
+            posts.append(post)
+        with transaction.atomic():
+            Post.objects.bulk_create(posts)
+            fan_out([post.pk for post in posts if post.moderated])
+        self.feed_changed = self.feed_changed or any(post.moderated for post in posts)
+        return len(posts), 0
+
+    def finish(self, created):
+        if self.feed_changed:
+            invalidate_feed()
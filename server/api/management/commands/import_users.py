@@ -0,0 +1,51 @@
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from api.importing import ImportCommand, RowError, clean_fields
+from api.models import AUTHORS_GROUP, User, group_id
+
+FIELDS = ('username', 'email', 'first_name', 'last_name', 'role', 'bio', 'age')
+
+
+class Command(ImportCommand):
+    help = (
+        'Create users from JSON Lines or CSV without loading the file into memory. '
+        'Columns: username, email, first_name, last_name, role, bio, age, and either '
+        'password (plain text, hashed here, which is slow) or password_hash (stored as is). '
+        'Users without either get an unusable password. Existing usernames are skipped.'
+    )
+    noun = 'users'
+
+    def clean_row(self, row):
+        values = clean_fields(User, row, FIELDS)
+        if 'username' not in values:
+            raise RowError('username is required')
+        if row.get('password_hash'):
+            values['password'] = row['password_hash']
+        else:
+            values['password'] = make_password(row.get('password') or None)
+        return values
+
+    def import_batch(self, rows):
+        by_username = {}
+        for _, values in rows:
+            by_username.setdefault(values['username'], values)
+        existing = set(
+            User.objects.filter(username__in=by_username).values_list('username', flat=True)
+        )
+        users = [User(**values) for name, values in by_username.items() if name not in existing]
+        with transaction.atomic():
+            # bulk_create skips User.save, so the Authors group is added
+            # here with one insert into the join table
+            User.objects.bulk_create(users)
+            if users and users[0].pk is None:
+                # Backends without RETURNING don't set primary keys
+                pks = dict(User.objects.filter(username__in=[user.username for user in users])
+                           .values_list('username', 'pk'))
+                for user in users:
+                    user.pk = pks[user.username]
+            authors = group_id(AUTHORS_GROUP)
+            User.groups.through.objects.bulk_create(
+                User.groups.through(user_id=user.pk, group_id=authors) for user in users
+            )
+        return len(users), len(rows) - len(users)
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max
+
+from api.cache import invalidate_activity_feed, invalidate_posts
+from api.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Recompute Post.comment_count and Post.last_activity_at from the comments table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='report drift without writing')
+
+    def handle(self, *args, batch_size, dry_run, **options):
+        checked = repaired = 0
+        last_id = 0
+        while True:
+            # Walk by primary key so each batch is an index range scan
+            rows = list(
+                Post.objects.filter(pk__gt=last_id).order_by('pk')
+                .annotate(actual_count=Count('comments'), latest=Max('comments__create_date'))
+                .values('pk', 'create_date', 'comment_count', 'last_activity_at', 'actual_count', 'latest')
+                [:batch_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1]['pk']
+            checked += len(rows)
+
+            stale = []
+            for row in rows:
+                activity = row['latest'] or row['create_date']
+                if row['comment_count'] != row['actual_count'] or row['last_activity_at'] != activity:
+                    stale.append(Post(pk=row['pk'], comment_count=row['actual_count'], last_activity_at=activity))
+            repaired += len(stale)
+            if stale and not dry_run:
+                with transaction.atomic():
+                    Post.objects.bulk_update(stale, ['comment_count', 'last_activity_at'])
+                    invalidate_posts([post.pk for post in stale])
+
+        if repaired and not dry_run:
+            invalidate_activity_feed()
+        verb = 'would repair' if dry_run else 'repaired'
+        self.stdout.write(f'Checked {checked} posts, {verb} {repaired}.')
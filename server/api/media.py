@@ -0,0 +1,239 @@
+"""
+Content-addressed media storage and serving.
+
+ContentAddressedStorage, the default storage, hashes an upload while
+it is written and stores it as ``blobs/ab/cd/<sha256><ext>``. An upload
+whose bytes are already stored reuses the existing file. Image variants
+go through the same storage, so they are deduplicated too.
+
+A file can be shared by many rows, so it is never deleted when a row
+stops using it. A MediaBlob row per file counts the User, Post and
+ArchivedPost rows that reference it, as an image or as one of its
+variants. The signals in api/signals.py keep the count; ``collect_media``
+deletes files that nobody has referenced for MEDIA_GC_GRACE_SECONDS.
+
+``serve`` answers MEDIA_URL. Blob names never change content, so blobs
+are sent with an immutable Cache-Control. With MEDIA_OFFLOAD set to
+``X-Accel-Redirect`` (nginx) or ``X-Sendfile`` (Apache, lighttpd), the
+response carries only headers and the front server sends the file,
+Range requests included. Otherwise the file is streamed from here.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db.models import F
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import require_safe
+
+from .models import MediaBlob
+
+BLOB_DIR = 'blobs'
+CHUNK_SIZE = 64 * 1024
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def blob_name(digest, ext):
+    return f'{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+
+
+def is_blob(name):
+    return name.startswith(BLOB_DIR + '/')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # The name is chosen from the content in _save
+        return name
+
+    def _save(self, name, content):
+        ext = os.path.splitext(name)[1].lower()
+        hasher = hashlib.sha256()
+        if hasattr(content, 'temporary_file_path'):
+            # Already on disk: hash it, then move it instead of copying
+            source = content.temporary_file_path()
+            with open(source, 'rb') as handle:
+                for chunk in iter(lambda: handle.read(CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+            staged = False
+        else:
+            os.makedirs(self.location, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=self.location, prefix='.upload-', delete=False) as handle:
+                source = handle.name
+                for chunk in content.chunks(CHUNK_SIZE):
+                    hasher.update(chunk)
+                    handle.write(chunk)
+            staged = True
+
+        name = blob_name(hasher.hexdigest(), ext)
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            if staged:
+                os.unlink(source)
+        else:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            if staged:
+                os.replace(source, full_path)
+            else:
+                file_move_safe(source, full_path, allow_overwrite=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(full_path, self.file_permissions_mode)
+        MediaBlob.objects.update_or_create(
+            name=name, defaults={'size': os.path.getsize(full_path), 'touched_at': timezone.now()}
+        )
+        return name
+
+
+def stored_names(name, variants):
+    """Storage names one image field holds: the file and its variants."""
+    if not name:
+        return set()
+    return {name, *(variants or {}).values()}
+
+
+def _adjust(counts, sign):
+    by_delta = defaultdict(list)
+    for name, count in counts.items():
+        by_delta[count].append(name)
+    now = timezone.now()
+    for count, names in by_delta.items():
+        MediaBlob.objects.filter(name__in=names).update(refs=F('refs') + sign * count, touched_at=now)
+
+
+def retain(names):
+    counts = Counter(names)
+    if counts:
+        # Files stored before this table existed get their row here
+        MediaBlob.objects.bulk_create([MediaBlob(name=name) for name in counts], ignore_conflicts=True)
+        _adjust(counts, 1)
+
+
+def release(names):
+    counts = Counter(names)
+    if counts:
+        _adjust(counts, -1)
+
+
+def known_variants(name, storage):
+    """Variants built earlier from the same file, if they are all still stored."""
+    blob = MediaBlob.objects.filter(name=name).only('variants').first()
+    if blob is None or not blob.variants:
+        return None
+    # Touch them so collect_media leaves them be until they are retained
+    MediaBlob.objects.filter(name__in=blob.variants.values()).update(touched_at=timezone.now())
+    if not all(storage.exists(variant) for variant in blob.variants.values()):
+        return None
+    return blob.variants
+
+
+def remember_variants(name, variants):
+    MediaBlob.objects.filter(name=name).update(variants=variants)
+
+
+def grace_seconds():
+    return getattr(settings, 'MEDIA_GC_GRACE_SECONDS', 3600)
+
+
+def collect(storage=None, grace=None, dry_run=False):
+    """Delete files no row has referenced for ``grace`` seconds; return (count, bytes)."""
+    storage = storage or default_storage
+    grace = grace_seconds() if grace is None else grace
+    cutoff = timezone.now() - timedelta(seconds=grace)
+    orphans = MediaBlob.objects.filter(refs__lte=0, touched_at__lt=cutoff)
+    deleted = freed = 0
+    for pk, name, size in orphans.values_list('pk', 'name', 'size').iterator():
+        if dry_run:
+            deleted, freed = deleted + 1, freed + (size or 0)
+            continue
+        # Re-check in the DELETE in case the file was reused meanwhile
+        if MediaBlob.objects.filter(pk=pk, refs__lte=0, touched_at__lt=cutoff).delete()[0]:
+            storage.delete(name)
+            deleted, freed = deleted + 1, freed + (size or 0)
+    return deleted, freed
+
+
+def _parse_range(header, size):
+    """(start, end) for a single ``bytes=`` range, None to ignore it, or False if unsatisfiable."""
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as handle:
+        handle.seek(start)
+        while length > 0:
+            chunk = handle.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@require_safe
+def serve(request, path):
+    storage = default_storage
+    try:
+        full_path = storage.path(path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    headers = {'Accept-Ranges': 'bytes'}
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if is_blob(path):
+        etag = '"{}"'.format(os.path.splitext(os.path.basename(path))[0])
+        headers.update({'ETag': etag, 'Cache-Control': IMMUTABLE})
+        if request.headers.get('If-None-Match') == etag:
+            return HttpResponseNotModified(headers=headers)
+    else:
+        # Stored before blobs, under a name that could be reused
+        etag = None
+        headers['Cache-Control'] = 'public, max-age=3600'
+
+    offload = getattr(settings, 'MEDIA_OFFLOAD', '')
+    if offload == 'X-Accel-Redirect':
+        headers[offload] = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/') + path
+        return HttpResponse(content_type=content_type, headers=headers)
+    if offload == 'X-Sendfile':
+        headers[offload] = full_path
+        return HttpResponse(content_type=content_type, headers=headers)
+
+    size = os.path.getsize(full_path)
+    byte_range = None
+    if 'Range' in request.headers and request.headers.get('If-Range', etag) == etag:
+        byte_range = _parse_range(request.headers['Range'], size)
+    if byte_range is False:
+        headers['Content-Range'] = f'bytes */{size}'
+        return HttpResponse(status=416, headers=headers)
+    if byte_range is None:
+        # FileResponse lets the WSGI server use sendfile
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+        for name, value in headers.items():
+            response[name] = value
+        return response
+    start, end = byte_range
+    length = end - start + 1
+    headers.update({'Content-Range': f'bytes {start}-{end}/{size}', 'Content-Length': str(length)})
+    return StreamingHttpResponse(
+        _read_range(full_path, start, length), status=206, content_type=content_type, headers=headers
+    )
@@ -0,0 +1,315 @@
+"""
+Per-request instrumentation, switched on by REQUEST_METRICS.
+
+MetricsMiddleware records, for each request:
+
+- the view and action that handled it, e.g. ``PostViewSet.list``
+- total latency
+- database query count and time
+- time spent in top-level ``serializer.data``
+- cache hits and misses counted by api.cache
+- response size
+
+Each request is logged as one JSON line on the ``api.requests`` logger.
+It is also added to in-process counters and latency histograms, which
+``/metrics`` serves in the Prometheus text format. Requests slower than
+SLOW_REQUEST_SECONDS are logged again at WARNING with their SQL.
+
+Metrics are kept per process. With several workers, each scrape sees
+the worker that answered it; run one scrape target per worker, or
+aggregate by the ``pid`` label.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger('api.requests')
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+# Counters bumped through Registry.count, whatever REQUEST_METRICS says
+EVENTS = {
+    'throttled_requests': 'Requests rejected by a throttle bucket.',
+    'like_writes_coalesced': 'Like toggles folded into a later net write.',
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Statements kept per request for the slow-request log
+MAX_LOGGED_QUERIES = 100
+
+
+def enabled():
+    return getattr(settings, 'REQUEST_METRICS', False)
+
+
+def slow_threshold():
+    return getattr(settings, 'SLOW_REQUEST_SECONDS', 1.0)
+
+
+class RequestMetrics:
+    __slots__ = ('view', 'queries', 'db_time', 'serializer_time', 'serializer_depth',
+                 'cache_hits', 'cache_misses', 'statements')
+
+    def __init__(self):
+        self.view = 'unmatched'
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.statements = []
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper, installed on every connection by ApiConfig.ready."""
+    current = _current.get()
+    if current is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        current.queries += 1
+        current.db_time += elapsed
+        if len(current.statements) < MAX_LOGGED_QUERIES:
+            current.statements.append((sql, elapsed))
+
+
+def install_query_wrapper(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def count_cache(stat, amount):
+    current = _current.get()
+    if current is not None:
+        if stat == 'misses':
+            current.cache_misses += amount
+        else:
+            current.cache_hits += amount
+
+
+@contextmanager
+def serializer_timer():
+    current = _current.get()
+    if current is None:
+        yield
+        return
+    # Serializers nested inside a timed one are already counted
+    current.serializer_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.serializer_depth -= 1
+        if not current.serializer_depth:
+            current.serializer_time += time.perf_counter() - started
+
+
+def view_name(view_func, method):
+    # DRF viewsets carry their class and the method -> action map
+    cls = getattr(view_func, 'cls', None)
+    name = getattr(view_func, 'view_class_name', None) or getattr(cls, '__name__', None)
+    if name is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    actions = getattr(view_func, 'actions', None)
+    if actions:
+        return f'{name}.{actions.get(method.lower(), method.lower())}'
+    return name
+
+
+class Registry:
+    """Counters and histograms labelled by (view, method)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.events = defaultdict(int)
+        self.requests = defaultdict(int)
+        self.buckets = defaultdict(lambda: [0] * len(LATENCY_BUCKETS))
+        self.totals = defaultdict(lambda: defaultdict(float))
+
+    def observe(self, view, method, status_code, latency, measured, size):
+        key = (view, method)
+        with self.lock:
+            self.requests[(view, method, status_code)] += 1
+            buckets = self.buckets[key]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    buckets[i] += 1
+            totals = self.totals[key]
+            totals['count'] += 1
+            totals['seconds'] += latency
+            totals['db_queries'] += measured.queries
+            totals['db_seconds'] += measured.db_time
+            totals['serializer_seconds'] += measured.serializer_time
+            totals['cache_hits'] += measured.cache_hits
+            totals['cache_misses'] += measured.cache_misses
+            totals['response_bytes'] += size or 0
+
+    def count(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.events[key] += amount
+
+    def render(self):
+        pid = os.getpid()
+        lines = []
+
+        def labels(view, method, **extra):
+            pairs = {'view': view, 'method': method, 'pid': pid, **extra}
+            return ','.join(f'{name}="{value}"' for name, value in pairs.items())
+
+        with self.lock:
+            lines += ['# HELP api_requests_total Requests handled.', '# TYPE api_requests_total counter']
+            for (view, method, code), count in sorted(self.requests.items()):
+                lines.append(f'api_requests_total{{{labels(view, method, status=code)}}} {count}')
+
+            lines += ['# HELP api_request_duration_seconds Request latency.',
+                      '# TYPE api_request_duration_seconds histogram']
+            for (view, method), buckets in sorted(self.buckets.items()):
+                totals = self.totals[(view, method)]
+                for bound, count in zip(LATENCY_BUCKETS, buckets):
+                    lines.append(
+                        f'api_request_duration_seconds_bucket{{{labels(view, method, le=bound)}}} {count}'
+                    )
+                lines.append(
+                    f'api_request_duration_seconds_bucket{{{labels(view, method, le="+Inf")}}} '
+                    f'{int(totals["count"])}'
+                )
+                lines.append(f'api_request_duration_seconds_sum{{{labels(view, method)}}} {totals["seconds"]}')
+                lines.append(f'api_request_duration_seconds_count{{{labels(view, method)}}} {int(totals["count"])}')
+
+            for name, kind, help_text in (
+                ('db_queries', 'counter', 'Database queries run.'),
+                ('db_seconds', 'counter', 'Time spent in database queries.'),
+                ('serializer_seconds', 'counter', 'Time spent serializing responses.'),
+                ('cache_hits', 'counter', 'API cache hits, including stale hits.'),
+                ('cache_misses', 'counter', 'API cache misses.'),
+                ('response_bytes', 'counter', 'Response body bytes.'),
+            ):
+                metric = f'api_request_{name}_total'
+                lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} {kind}']
+                for (view, method), totals in sorted(self.totals.items()):
+                    lines.append(f'{metric}{{{labels(view, method)}}} {_number(totals[name])}')
+
+            for name, help_text in EVENTS.items():
+                metric = f'api_{name}_total'
+                lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+                for (event, pairs), count in sorted(self.events.items()):
+                    if event == name:
+                        pairs = ','.join(f'{key}="{value}"' for key, value in (*pairs, ('pid', pid)))
+                        lines.append(f'{metric}{{{pairs}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def _number(value):
+    return int(value) if value == int(value) else value
+
+
+def _response_size(response):
+    if getattr(response, 'streaming', False):
+        return None
+    return len(response.content)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not enabled():
+            return self.get_response(request)
+        current = RequestMetrics()
+        token = _current.set(current)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, current, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        if not enabled():
+            return await self.get_response(request)
+        current = RequestMetrics()
+        token = _current.set(current)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, current, time.perf_counter() - started)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        current = _current.get()
+        if current is not None:
+            current.view = view_name(view_func, request.method)
+        return None
+
+    def finish(self, request, response, current, latency):
+        if current.view == metrics.view_class_name:
+            return
+        size = _response_size(response)
+        registry.observe(current.view, request.method, response.status_code, latency, current, size)
+        entry = {
+            'view': current.view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'latency_ms': round(latency * 1000, 2),
+            'db_queries': current.queries,
+            'db_ms': round(current.db_time * 1000, 2),
+            'serializer_ms': round(current.serializer_time * 1000, 2),
+            'cache_hits': current.cache_hits,
+            'cache_misses': current.cache_misses,
+            'response_bytes': size,
+        }
+        logger.info(json.dumps(entry))
+        threshold = slow_threshold()
+        if threshold is not None and latency >= threshold:
+            entry['sql'] = [
+                {'ms': round(elapsed * 1000, 2), 'sql': sql} for sql, elapsed in current.statements
+            ]
+            logger.warning(json.dumps(entry))
+
+
+def metrics(request):
+    """Prometheus scrape endpoint: needs METRICS_TOKEN as a bearer token, or METRICS_PUBLIC."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        if request.META.get('HTTP_AUTHORIZATION') != f'Bearer {token}':
+            return HttpResponseForbidden()
+    elif not getattr(settings, 'METRICS_PUBLIC', False):
+        # Per-route traffic and latency are not for everyone
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Label for view_name, and excluded from its own metrics
+metrics.view_class_name = 'metrics'
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 20:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_timelines'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.BigIntegerField(null=True)),
+                ('refs', models.IntegerField(default=0)),
+                ('touched_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('variants', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('refs__lte', 0)), fields=['touched_at'], name='mediablob_orphan_idx')],
+            },
+        ),
+    ]
@@ -1,9 +1,35 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth.models import AbstractUser, Group, Permission
+from django.core.cache import cache
 from django.utils import timezone
+from .cache import invalidate_activity_feed, invalidate_post, invalidate_posts
+from .events import like_count_changed
+
+AUTHORS_GROUP = 'Authors'
 
 # Create your models here.
 
+
+def _group_id_key(name):
+    return f'group_id:{name}'
+
+
+def group_id(name):
+    """Primary key of the named group, created on first use and cached."""
+    key = _group_id_key(name)
+    pk = cache.get(key)
+    if pk is None:
+        pk = Group.objects.get_or_create(name=name)[0].pk
+        cache.set(key, pk, None)
+    return pk
+
+
+def forget_group_id(name):
+    cache.delete(_group_id_key(name))
+
+
 class User(AbstractUser):
     age = models.IntegerField(null=True, blank=True)
     bio = models.TextField(max_length=500, blank=True)
@@ -13,14 +39,48 @@ class User(AbstractUser):
         ('author', 'Author')
     ], default='author')
     profile_image = models.ImageField(upload_to='profile_images/', null=True, blank=True)
+    # Storage names of resized copies, filled in by api.images
+    profile_image_variants = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Bumped to revoke every JWT issued before a change to these fields
+    token_version = models.PositiveIntegerField(default=0)
+    # Maintained by api.timelines.follow/unfollow; decides fan-out vs fan-in
+    follower_count = models.PositiveIntegerField(default=0)
+
+    TOKEN_CLAIM_FIELDS = ('role', 'is_staff', 'is_superuser', 'is_active', 'password')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_claims = {
+            name: value for name, value in zip(field_names, values)
+            if name in cls.TOKEN_CLAIM_FIELDS
+        }
+        return instance
+
+    def token_claims_changed(self):
+        loaded = getattr(self, '_loaded_claims', {})
+        return any(getattr(self, name) != value for name, value in loaded.items())
 
     def save(self, *args, **kwargs):
+        revoke = self._tokens_revoked = self.token_claims_changed()
+        if revoke:
+            # Bump in SQL so a stale instance can't move the version backwards
+            self.token_version = F('token_version') + 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'token_version'}
         if not self.pk:  # Only on creation
             super().save(*args, **kwargs)
-            author_group, _ = Group.objects.get_or_create(name='Authors')
-            self.groups.add(author_group)
+            # Through the join table directly: a brand-new user has no
+            # tokens to revoke, so skip the groups m2m_changed signal.
+            User.groups.through.objects.create(user_id=self.pk, group_id=group_id(AUTHORS_GROUP))
         else:
             super().save(*args, **kwargs)
+        if revoke:
+            self.refresh_from_db(fields=['token_version'])
+        self._loaded_claims = {
+            name: self.__dict__[name] for name in self.TOKEN_CLAIM_FIELDS if name in self.__dict__
+        }
 
 class Post(models.Model):
     title = models.CharField(max_length=200)
@@ -29,17 +89,214 @@ class Post(models.Model):
     moderated = models.BooleanField(default=False)
     create_date = models.DateTimeField(default=timezone.now)
     moderator = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='moderated_posts')
+    rejected = models.BooleanField(default=False)
+    # Moderation lease, see api.moderation
+    claimed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='claimed_posts')
+    claim_expires = models.DateTimeField(null=True, blank=True)
     like_count = models.IntegerField(default=0)
+    # Maintained by comment_added/comment_removed; repair with
+    # ``manage.py repair_post_counters``
+    comment_count = models.IntegerField(default=0)
+    last_activity_at = models.DateTimeField(default=timezone.now)
     post_image = models.ImageField(upload_to='post_images/', null=True, blank=True)
+    post_image_variants = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the feed seeks on (create_date, id)
+            models.Index(fields=['moderated', '-create_date', '-id'], name='post_feed_idx'),
+            models.Index(fields=['-create_date', '-id'], name='post_created_idx'),
+            # ?ordering=activity on the feed. Partial, because SQLite only
+            # matches a bare boolean filter against an index condition.
+            models.Index(
+                fields=['-last_activity_at', '-id'], name='post_activity_idx',
+                condition=models.Q(moderated=True),
+            ),
+            # Fan-in half of the following feed (api.timelines)
+            models.Index(
+                fields=['author', '-create_date', '-id'], name='post_author_feed_idx',
+                condition=models.Q(moderated=True),
+            ),
+            # Only the pending backlog, walked oldest first by moderators
+            models.Index(
+                fields=['create_date', 'id'], name='post_queue_idx',
+                condition=models.Q(moderated=False, rejected=False),
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            # A post's activity starts when it is written
+            self.last_activity_at = self.create_date
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def comment_added(cls, post_id, create_date):
+        cls.comments_added({post_id: (1, create_date)})
+
+    @classmethod
+    def comments_added(cls, added):
+        """``added`` maps post id to (number of new comments, newest create_date)."""
+        now = timezone.now()
+        for post_id, (count, latest) in added.items():
+            cls.objects.filter(pk=post_id).update(
+                comment_count=F('comment_count') + count,
+                last_activity_at=Greatest('last_activity_at', Value(latest)),
+                updated_at=now,
+            )
+        invalidate_posts(list(added))
+        invalidate_activity_feed()
+
+    @classmethod
+    def comment_removed(cls, post_id):
+        # Activity falls back to the newest remaining comment, or the post
+        latest = Comment.objects.filter(post_id=OuterRef('pk')).order_by().values('post_id').annotate(
+            latest=Max('create_date')
+        ).values('latest')
+        cls.objects.filter(pk=post_id, comment_count__gt=0).update(
+            comment_count=F('comment_count') - 1,
+            last_activity_at=Coalesce(Subquery(latest), F('create_date')),
+            updated_at=timezone.now(),
+        )
+        invalidate_post(post_id)
+        invalidate_activity_feed()
+
+    def add_like(self, user):
+        # The PostLike row makes liking idempotent; the counter is bumped in
+        # SQL so concurrent likes never overwrite each other.
+        with transaction.atomic():
+            _, created = PostLike.objects.get_or_create(user_id=user.pk, post=self)
+            if created:
+                Post.objects.filter(pk=self.pk).update(
+                    like_count=F('like_count') + 1, updated_at=timezone.now()
+                )
+                invalidate_post(self.pk)
+        self.refresh_from_db(fields=['like_count'])
+        if created:
+            like_count_changed(self.pk, self.like_count)
+        return created
+
+    def remove_like(self, user):
+        with transaction.atomic():
+            deleted, _ = PostLike.objects.filter(user_id=user.pk, post=self).delete()
+            if deleted:
+                Post.objects.filter(pk=self.pk, like_count__gt=0).update(
+                    like_count=F('like_count') - 1, updated_at=timezone.now()
+                )
+                invalidate_post(self.pk)
+        self.refresh_from_db(fields=['like_count'])
+        if deleted:
+            like_count_changed(self.pk, self.like_count)
+        return bool(deleted)
+
 class Comment(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comments')
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     content = models.TextField()
     create_date = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'create_date', 'id'], name='comment_post_created_idx'),
+            models.Index(fields=['create_date', 'id'], name='comment_created_idx'),
+        ]
 
     def __str__(self):
         return f'Comment by {self.author.username} on {self.post.title}'
+
+
+class PostLike(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='likes')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='likes')
+    create_date = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'user'], name='unique_post_like'),
+        ]
+
+    def __str__(self):
+        return f'{self.user.username} likes {self.post.title}'
+
+
+class Follow(models.Model):
+    # The unique constraint's index leads with follower
+    follower = models.ForeignKey(User, on_delete=models.CASCADE, related_name='following', db_index=False)
+    followee = models.ForeignKey(User, on_delete=models.CASCADE, related_name='followers', db_index=False)
+    create_date = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['follower', 'followee'], name='unique_follow'),
+        ]
+        indexes = [
+            # Fan-out reads an author's follower ids straight from the index
+            models.Index(fields=['followee', 'follower'], name='follow_followee_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.follower_id} follows {self.followee_id}'
+
+
+class TimelineEntry(models.Model):
+    """A moderated post copied into one follower's following feed."""
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline', db_index=False)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    # Copied from the post so a page is one range scan of timeline_owner_idx
+    create_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'post'], name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', '-create_date', '-post'], name='timeline_owner_idx'),
+        ]
+
+
+class MediaBlob(models.Model):
+    """A stored media file; ``refs`` counts the User and Post rows that use it (api/media.py)."""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(null=True)
+    refs = models.IntegerField(default=0)
+    # Last upload or release; collect_media spares recently touched blobs
+    touched_at = models.DateTimeField(default=timezone.now)
+    # Variants already built from this image, reused when it is uploaded again
+    variants = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['touched_at'], condition=models.Q(refs__lte=0), name='mediablob_orphan_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.refs} refs)'
+
+
+class ArchivedPost(models.Model):
+    """A post moved out of the live tables by ``archive_content`` (api/archive.py)."""
+    id = models.BigIntegerField(primary_key=True)
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_posts')
+    moderated = models.BooleanField()
+    create_date = models.DateTimeField()
+    last_activity_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+    # The post's other columns, see archive.ARCHIVED_FIELDS
+    data = models.JSONField()
+
+    def __str__(self):
+        return self.data.get('title', str(self.pk))
+
+
+class ArchivedComment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    post = models.ForeignKey(ArchivedPost, on_delete=models.CASCADE, related_name='comments')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_comments')
+    content = models.TextField()
+    create_date = models.DateTimeField()
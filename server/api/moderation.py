@@ -0,0 +1,86 @@
+"""
+Moderation work queue.
+
+Pending posts (neither moderated nor rejected) are reviewed oldest first.
+A moderator claims a batch, which leases those posts to them for
+MODERATION_LEASE_SECONDS so other moderators' queues skip them. Approving
+or rejecting a batch is a single UPDATE that also releases the lease.
+Posts whose lease has expired go back to everyone's queue.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import cache, events, timelines
+from .models import Post
+
+
+def lease_seconds():
+    return getattr(settings, 'MODERATION_LEASE_SECONDS', 300)
+
+
+def max_batch_size():
+    return getattr(settings, 'MODERATION_BATCH_SIZE', 100)
+
+
+def available_to(user):
+    # Unclaimed, claimed by this moderator, or claimed with a lapsed lease
+    return Q(claimed_by__isnull=True) | Q(claimed_by_id=user.pk) | Q(claim_expires__lt=timezone.now())
+
+
+def pending():
+    # Matches the condition of the partial index post_queue_idx
+    return Post.objects.filter(moderated=False, rejected=False)
+
+
+def queue(user):
+    return pending().filter(available_to(user))
+
+
+def claim(user, limit):
+    """Lease up to ``limit`` of the oldest available posts to ``user``."""
+    expires = timezone.now() + timedelta(seconds=lease_seconds())
+    with transaction.atomic():
+        candidates = queue(user).exclude(claimed_by_id=user.pk).order_by('create_date', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            # Concurrent claimers on Postgres take disjoint batches
+            candidates = candidates.select_for_update(skip_locked=True)
+        post_ids = list(candidates.values_list('pk', flat=True)[:limit])
+        # Re-check availability in the UPDATE itself in case another
+        # moderator got there first.
+        queue(user).filter(pk__in=post_ids).update(claimed_by_id=user.pk, claim_expires=expires)
+    return expires
+
+
+def release(user):
+    return Post.objects.filter(claimed_by_id=user.pk).update(claimed_by=None, claim_expires=None)
+
+
+def moderate(user, post_ids, approve):
+    """Approve or reject the pending posts among ``post_ids`` in one UPDATE."""
+    now = timezone.now()
+    with transaction.atomic():
+        updated = queue(user).filter(pk__in=post_ids).update(
+            moderated=approve,
+            rejected=not approve,
+            moderator_id=user.pk,
+            claimed_by=None,
+            claim_expires=None,
+            updated_at=now,
+        )
+        if not updated:
+            return 0
+        # Only the rows this UPDATE stamped: ids that were already reviewed
+        # must not be announced or fanned out again
+        changed = list(Post.objects.filter(
+            pk__in=post_ids, moderator_id=user.pk, moderated=approve, updated_at=now,
+        ).values_list('pk', flat=True))
+    # QuerySet.update() sends no post_save, so invalidate here
+    cache.invalidate_posts(changed, feed=approve)
+    if approve:
+        timelines.fan_out(changed)
+        events.posts_published(changed)
+    return updated
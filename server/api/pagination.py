@@ -0,0 +1,236 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opaque cursor pagination that seeks on the full ordering tuple, e.g.
+    (create_date, id), so every page is an index range scan with no OFFSET.
+    """
+    ordering = ('-id',)
+    cursor_query_param = 'cursor'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self._finish_page(list(self._page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        # Same page as paginate_queryset, fetched with the async ORM
+        queryset = self._page_queryset(queryset, request)
+        return self._finish_page([row async for row in queryset])
+
+    def _page_queryset(self, queryset, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+        self.descending = [name.startswith('-') for name in self.ordering]
+
+        self.position, self.reverse = self.decode_cursor(request, queryset.model)
+        ordering = self.ordering if not self.reverse else self._flip(self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if self.position is not None:
+            queryset = queryset.filter(self._seek(self.position, self.reverse))
+        return queryset[:self.page_size + 1]
+
+    def _finish_page(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, instance, reverse):
+        payload = {'p': [getattr(instance, name) for name in self.fields]}
+        if reverse:
+            payload['r'] = 1
+        return replace_query_param(self.base_url, self.cursor_query_param, self._encode_token(payload))
+
+    def decode_cursor(self, request, model):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = self._decode_token(token)
+            values = payload['p']
+            if len(values) != len(self.fields):
+                raise ValueError
+            position = [
+                model._meta.get_field(name).to_python(value)
+                for name, value in zip(self.fields, values)
+            ]
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, bool(payload.get('r'))
+
+    @staticmethod
+    def _encode_token(payload):
+        # isoformat() rather than DjangoJSONEncoder, which drops microseconds
+        # and would make the seek skip or repeat rows.
+        raw = json.dumps(payload, default=lambda value: value.isoformat(), separators=(',', ':'))
+        return urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def _decode_token(token):
+        return json.loads(urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+
+    def _seek(self, position, reverse):
+        # (a, b) after (x, y)  ==  a > x OR (a = x AND b > y)
+        condition = Q()
+        for i, name in enumerate(self.fields):
+            lookup = 'lt' if self.descending[i] != reverse else 'gt'
+            clause = Q(**{f'{name}__{lookup}': position[i]})
+            for prev, value in zip(self.fields[:i], position[:i]):
+                clause &= Q(**{prev: value})
+            condition |= clause
+        return condition
+
+    @staticmethod
+    def _flip(ordering):
+        return tuple(name[1:] if name.startswith('-') else f'-{name}' for name in ordering)
+
+
+class PostPagination(KeysetPagination):
+    ordering = ('-create_date', '-id')
+
+
+class PostActivityPagination(KeysetPagination):
+    ordering = ('-last_activity_at', '-id')
+
+
+def post_pagination(request):
+    # The feed is newest first unless ?ordering=activity asks for the most
+    # recently commented posts first.
+    if request.query_params.get('ordering') == 'activity':
+        return PostActivityPagination()
+    return PostPagination()
+
+
+class ModerationQueuePagination(KeysetPagination):
+    # Oldest first, so the backlog is cleared in arrival order
+    ordering = ('create_date', 'id')
+
+
+class CommentPagination(KeysetPagination):
+    ordering = ('create_date', 'id')
+
+
+class UserPagination(KeysetPagination):
+    ordering = ('id',)
+
+
+class SearchPagination(KeysetPagination):
+    """
+    Forward-only cursor over the ranked (rank, post_id) pairs returned by
+    api.search, seeking past the last pair instead of re-ranking and
+    skipping earlier pages.
+    """
+
+    def paginate_search(self, search, query, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        after = None
+        token = request.query_params.get(self.cursor_query_param)
+        if token:
+            try:
+                rank, post_id = self._decode_token(token)['p']
+                after = (float(rank), int(post_id))
+            except (TypeError, ValueError, KeyError):
+                raise NotFound(self.invalid_cursor_message)
+
+        rows = search(query, after=after, limit=self.page_size + 1)
+        self.has_next = len(rows) > self.page_size
+        self.has_previous = False
+        self.page = rows[:self.page_size]
+        return [post_id for _, post_id in self.page]
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        token = self._encode_token({'p': list(self.page[-1])})
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+
+class TimelinePagination(SearchPagination):
+    """
+    Forward-only cursor over the (create_date, post_id) pairs of a
+    following feed, see api.timelines.
+    """
+
+    def paginate_timeline(self, timeline, user_id, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        after = None
+        token = request.query_params.get(self.cursor_query_param)
+        if token:
+            try:
+                create_date, post_id = self._decode_token(token)['p']
+                after = (parse_datetime(create_date), int(post_id))
+                if after[0] is None:
+                    raise ValueError
+            except (TypeError, ValueError, KeyError):
+                raise NotFound(self.invalid_cursor_message)
+
+        rows = timeline(user_id, after=after, limit=self.page_size + 1)
+        self.has_next = len(rows) > self.page_size
+        self.has_previous = False
+        self.page = rows[:self.page_size]
+        return [post_id for _, post_id in self.page]
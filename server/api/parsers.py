@@ -0,0 +1,14 @@
+import msgpack
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class MessagePackParser(BaseParser):
+    """Request bodies in ``application/msgpack``, e.g. a bulk create list."""
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False, strict_map_key=True)
+        except ValueError as exc:  # includes ExtraData, FormatError, StackError
+            raise ParseError(f'MessagePack parse error - {exc}')
@@ -1,16 +1,28 @@
 from rest_framework import permissions
 
+
+def in_group(user, name):
+    # Users authenticated by JWT carry their group names in the token
+    group_names = getattr(user, 'group_names', None)
+    if group_names is not None:
+        return name in group_names
+    return user.groups.filter(name=name).exists()
+
+
+def is_moderator(user):
+    return user.is_authenticated and (user.is_staff or user.role in ('moderator', 'admin'))
+
 class IsAuthorOrReadOnly(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.method in permissions.SAFE_METHODS:
             return True
-        return obj.author == request.user or request.user.is_staff
+        return obj.author_id == request.user.pk or request.user.is_staff
 
 class IsModeratorOrReadOnly(permissions.BasePermission):
     def has_permission(self, request, view):
         if request.method in permissions.SAFE_METHODS:
             return True
-        return request.user.groups.filter(name='Moderators').exists() or request.user.is_staff
+        return in_group(request.user, 'Moderators') or request.user.is_staff
 
 class IsAdminOrReadOnly(permissions.BasePermission):
     def has_permission(self, request, view):
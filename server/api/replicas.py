@@ -0,0 +1,98 @@
+"""
+Read-replica routing for the API viewsets.
+
+ReplicaMiddleware lets safe-method requests to the user, post and comment
+viewsets read from a replica. After a client writes, its later reads stay
+on the primary for REPLICA_STICKY_SECONDS, so it sees its own write while
+the replicas catch up. Clients are told apart by their Authorization
+header, or by IP address when they have none.
+"""
+import contextvars
+import hashlib
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+
+_use_replica = contextvars.ContextVar('use_replica', default=False)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica_')]
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get():
+            replicas = replica_aliases()
+            if replicas:
+                return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas mirror the primary, so rows from either may be related
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+def _client_key(request):
+    identity = request.META.get('HTTP_AUTHORIZATION') or request.META.get('REMOTE_ADDR', '')
+    return 'db_pin:' + hashlib.sha1(identity.encode()).hexdigest()
+
+
+def _replica_view(view_func):
+    from .views import UserViewSet, PostViewSet, CommentViewSet
+    return getattr(view_func, 'cls', None) in (UserViewSet, PostViewSet, CommentViewSet)
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _use_replica.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_replica.reset(token)
+        self.pin_after_write(request)
+        return response
+
+    async def __acall__(self, request):
+        token = _use_replica.set(False)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _use_replica.reset(token)
+        self.pin_after_write(request)
+        return response
+
+    def pin_after_write(self, request):
+        if request.method not in SAFE_METHODS and replica_aliases():
+            cache.set(_client_key(request), 1, getattr(settings, 'REPLICA_STICKY_SECONDS', 5))
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            request.method in SAFE_METHODS
+            and replica_aliases()
+            and _replica_view(view_func)
+            and not cache.get(_client_key(request))
+        ):
+            _use_replica.set(True)
+        return None
+
@@ -0,0 +1,192 @@
+"""
+Full-text search over post titles, post bodies and comments.
+
+SQLite uses FTS5 external-content tables kept in sync by triggers, so
+bulk writes are indexed too. Postgres uses stored tsvector columns with
+GIN indexes. Both backends return (rank, post_id) pairs ordered
+best-first, where a lower rank is better, so one keyset cursor works for
+either.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Post
+
+SQLITE_FTS = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS api_post_fts USING fts5("
+    "title, content, content='api_post', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS api_comment_fts USING fts5("
+    "content, content='api_comment', content_rowid='id', tokenize='porter unicode61')",
+]
+
+SQLITE_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS api_post_fts_ai AFTER INSERT ON api_post BEGIN
+        INSERT INTO api_post_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS api_post_fts_ad AFTER DELETE ON api_post BEGIN
+        INSERT INTO api_post_fts(api_post_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS api_post_fts_au AFTER UPDATE OF title, content ON api_post BEGIN
+        INSERT INTO api_post_fts(api_post_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO api_post_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS api_comment_fts_ai AFTER INSERT ON api_comment BEGIN
+        INSERT INTO api_comment_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS api_comment_fts_ad AFTER DELETE ON api_comment BEGIN
+        INSERT INTO api_comment_fts(api_comment_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS api_comment_fts_au AFTER UPDATE OF content ON api_comment BEGIN
+        INSERT INTO api_comment_fts(api_comment_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO api_comment_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+]
+
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS api_post_fts_ai',
+    'DROP TRIGGER IF EXISTS api_post_fts_ad',
+    'DROP TRIGGER IF EXISTS api_post_fts_au',
+    'DROP TRIGGER IF EXISTS api_comment_fts_ai',
+    'DROP TRIGGER IF EXISTS api_comment_fts_ad',
+    'DROP TRIGGER IF EXISTS api_comment_fts_au',
+    'DROP TABLE IF EXISTS api_post_fts',
+    'DROP TABLE IF EXISTS api_comment_fts',
+]
+
+POSTGRES_INDEX = [
+    """ALTER TABLE api_post ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(content, '')), 'B')
+    ) STORED""",
+    "CREATE INDEX IF NOT EXISTS api_post_search_idx ON api_post USING GIN (search_vector)",
+    """ALTER TABLE api_comment ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        to_tsvector('english', coalesce(content, ''))
+    ) STORED""",
+    "CREATE INDEX IF NOT EXISTS api_comment_search_idx ON api_comment USING GIN (search_vector)",
+]
+
+POSTGRES_DROP = [
+    'DROP INDEX IF EXISTS api_post_search_idx',
+    'ALTER TABLE api_post DROP COLUMN IF EXISTS search_vector',
+    'DROP INDEX IF EXISTS api_comment_search_idx',
+    'ALTER TABLE api_comment DROP COLUMN IF EXISTS search_vector',
+]
+
+# Matches found only in comments rank below matches in the post itself
+COMMENT_WEIGHT = 0.5
+
+
+def install(conn, rebuild=False):
+    """Create the search index for ``conn``'s backend; safe to call repeatedly."""
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            for statement in SQLITE_FTS + SQLITE_TRIGGERS:
+                cursor.execute(statement)
+            if rebuild:
+                cursor.execute("INSERT INTO api_post_fts(api_post_fts) VALUES ('rebuild')")
+                cursor.execute("INSERT INTO api_comment_fts(api_comment_fts) VALUES ('rebuild')")
+        elif conn.vendor == 'postgresql':
+            for statement in POSTGRES_INDEX:
+                cursor.execute(statement)
+
+
+def uninstall(conn):
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            for statement in SQLITE_DROP:
+                cursor.execute(statement)
+        elif conn.vendor == 'postgresql':
+            for statement in POSTGRES_DROP:
+                cursor.execute(statement)
+
+
+def terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def _fts5_query(words):
+    # Quote every term so user input can't inject FTS5 syntax; the last
+    # term is a prefix match so results appear while the user is typing.
+    quoted = ['"%s"' % word for word in words]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _after_clause(after, rank_sql):
+    if after is None:
+        return '', []
+    return f'HAVING ({rank_sql} > %s OR ({rank_sql} = %s AND post_id > %s))', [after[0], after[0], after[1]]
+
+
+def _search_sqlite(words, after, limit):
+    match = _fts5_query(words)
+    having, having_params = _after_clause(after, 'MIN(score)')
+    sql = f"""
+        SELECT MIN(score) AS rank, post_id FROM (
+            SELECT rowid AS post_id, bm25(api_post_fts, 4.0, 1.0) AS score
+            FROM api_post_fts WHERE api_post_fts MATCH %s
+            UNION ALL
+            SELECT c.post_id, bm25(api_comment_fts) * {COMMENT_WEIGHT} AS score
+            FROM api_comment_fts JOIN api_comment c ON c.id = api_comment_fts.rowid
+            WHERE api_comment_fts MATCH %s
+        ) matches
+        JOIN api_post p ON p.id = matches.post_id AND p.moderated
+        GROUP BY post_id
+        {having}
+        ORDER BY rank, post_id
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, match, *having_params, limit])
+        return cursor.fetchall()
+
+
+def _search_postgres(words, after, limit):
+    tsquery = ' & '.join(words[:-1] + [f'{words[-1]}:*'])
+    having, having_params = _after_clause(after, 'MIN(score)')
+    sql = f"""
+        SELECT MIN(score) AS rank, post_id FROM (
+            SELECT p.id AS post_id, -ts_rank(p.search_vector, q) AS score
+            FROM api_post p, to_tsquery('english', %s) q
+            WHERE p.search_vector @@ q
+            UNION ALL
+            SELECT c.post_id, -ts_rank(c.search_vector, q) * {COMMENT_WEIGHT} AS score
+            FROM api_comment c, to_tsquery('english', %s) q
+            WHERE c.search_vector @@ q
+        ) matches
+        JOIN api_post p ON p.id = matches.post_id AND p.moderated
+        GROUP BY post_id
+        {having}
+        ORDER BY rank, post_id
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [tsquery, tsquery, *having_params, limit])
+        return cursor.fetchall()
+
+
+def _search_fallback(words, after, limit):
+    # No full-text index on this backend: match titles/bodies, newest first,
+    # using -id as the rank so the same cursor scheme still applies.
+    queryset = Post.objects.filter(moderated=True)
+    for word in words:
+        queryset = queryset.filter(Q(title__icontains=word) | Q(content__icontains=word))
+    if after is not None:
+        queryset = queryset.filter(id__lt=after[1])
+    return [(-pk, pk) for pk in queryset.order_by('-id').values_list('id', flat=True)[:limit]]
+
+
+def search_posts(query, after=None, limit=20):
+    """Return up to ``limit`` (rank, post_id) pairs ranked after ``after``."""
+    words = terms(query)
+    if not words:
+        return []
+    if connection.vendor == 'sqlite':
+        return _search_sqlite(words, after, limit)
+    if connection.vendor == 'postgresql':
+        return _search_postgres(words, after, limit)
+    return _search_fallback(words, after, limit)
@@ -1,16 +1,114 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from .models import Post, Comment
+from .images import StreamingImageField, variant_urls
+from .fieldsets import FieldSpec
+from . import fastpath, metrics
 
 User = get_user_model()
 
-class UserSerializer(serializers.ModelSerializer):
+
+class SparseFieldsMixin:
+    """Honours ?fields= and ?expand=, see api/fieldsets.py."""
+    # Nested serializer fields that ?expand= may collapse to an id
+    expandable_fields = {}
+    # Model columns read by fields whose source isn't a column of the same name
+    column_sources = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.context.get('fieldsets') is False:
+            return fields
+        spec = FieldSpec.from_request(self.context.get('request'))
+        if not spec.active:
+            return fields
+        path = self.field_path()
+        keep = spec.selected(path)
+        if keep is not None:
+            fields = {name: field for name, field in fields.items() if name in keep}
+        for name in self.expandable_fields:
+            full = f'{path}.{name}' if path else name
+            if name in fields and not spec.expanded(full):
+                source = fields[name].source
+                kwargs = {'source': source} if source and source != name else {}
+                fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, **kwargs)
+        return fields
+
+    def field_path(self):
+        names, node = [], self
+        while node.parent is not None:
+            # A list serializer's child is bound without a name
+            if node.field_name:
+                names.append(node.field_name)
+            node = node.parent
+        return '.'.join(reversed(names))
+
+
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Resolves the pk from ``context['preloaded'][model]`` when the caller
+    has fetched the related rows already, so validating a batch doesn't
+    run one query per item.
+    """
+
+    def to_internal_value(self, data):
+        preloaded = self.context.get('preloaded', {}).get(self.get_queryset().model)
+        if preloaded is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in preloaded:
+            self.fail('does_not_exist', pk_value=data)
+        return preloaded[pk]
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with metrics.serializer_timer():
+            return super().data
+
+
+class TimedDataMixin:
+    """Counts top-level ``.data`` time towards the request's serializer time (api.metrics)."""
+
+    @property
+    def data(self):
+        with metrics.serializer_timer():
+            return super().data
+
+
+class FastPathMixin:
+    """Serializes reads through api.fastpath when FAST_SERIALIZATION is on."""
+
+    def fast_plan(self):
+        if not hasattr(self, '_fast_plan'):
+            self._fast_plan = fastpath.compile_serializer(self)
+        return self._fast_plan
+
+    def to_representation(self, instance):
+        if fastpath.enabled():
+            return self.fast_plan()(instance)
+        return super().to_representation(instance)
+
+
+class UserSerializer(TimedDataMixin, FastPathMixin, SparseFieldsMixin, serializers.ModelSerializer):
+    column_sources = {'profile_image_variants': ('profile_image', 'profile_image_variants')}
+
     password = serializers.CharField(write_only=True, required=False)
-    image = serializers.ImageField(required=False, source='profile_image')
+    profile_image = StreamingImageField(required=False, allow_null=True)
+    image = StreamingImageField(required=False, source='profile_image')
+    profile_image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = User
-        fields = ('id', 'username', 'email', 'password', 'age', 'role', 'bio', 'profile_image', 'image', 'date_joined')
+        list_serializer_class = TimedListSerializer
+        fields = ('id', 'username', 'email', 'password', 'age', 'role', 'bio', 'profile_image', 'image',
+                  'profile_image_variants', 'date_joined')
         extra_kwargs = {
             'password': {'write_only': True},
             'date_joined': {'read_only': True}
@@ -30,27 +128,49 @@ class UserSerializer(serializers.ModelSerializer):
             
         return user
 
+    def get_profile_image_variants(self, obj):
+        return variant_urls(obj.profile_image, obj.profile_image_variants)
+
     def update(self, instance, validated_data):
         password = validated_data.pop('password', None)
         if password:
             instance.set_password(password)
         return super().update(instance, validated_data)
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(TimedDataMixin, FastPathMixin, SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {'author': UserSerializer}
+
     author = UserSerializer(read_only=True)
+    post = PreloadedPrimaryKeyRelatedField(queryset=Post.objects.all())
 
     class Meta:
         model = Comment
+        list_serializer_class = TimedListSerializer
         fields = ('id', 'author', 'post', 'content', 'create_date')
         read_only_fields = ('author', 'create_date')
 
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(TimedDataMixin, FastPathMixin, SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {'author': UserSerializer, 'moderator': UserSerializer}
+    column_sources = {'post_image_variants': ('post_image', 'post_image_variants')}
+
     author = UserSerializer(read_only=True)
     moderator = UserSerializer(read_only=True)
-    comments = CommentSerializer(many=True, read_only=True)
+    is_liked = serializers.SerializerMethodField()
+    post_image = StreamingImageField(required=False, allow_null=True)
+    post_image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
+        list_serializer_class = TimedListSerializer
         fields = ('id', 'title', 'author', 'content', 'moderated', 'create_date', 
-                 'moderator', 'like_count', 'comments')
-        read_only_fields = ('author', 'moderator', 'create_date', 'like_count') 
\ No newline at end of file
+                 'moderator', 'like_count', 'comment_count', 'last_activity_at', 'is_liked',
+                 'post_image', 'post_image_variants')
+        read_only_fields = ('author', 'moderator', 'create_date', 'like_count',
+                            'comment_count', 'last_activity_at')
+
+    def get_is_liked(self, obj):
+        # Annotated by PostViewSet.get_queryset; absent on freshly created posts
+        return getattr(obj, 'is_liked', False)
+
+    def get_post_image_variants(self, obj):
+        return variant_urls(obj.post_image, obj.post_image_variants) 
\ No newline at end of file
@@ -0,0 +1,149 @@
+from django.contrib.auth.models import Group
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import events, images, media, timelines
+from .authentication import forget_token_versions
+from .cache import invalidate_post, invalidate_user_posts
+from .models import ArchivedPost, User, Post, Comment, forget_group_id
+
+IMAGE_FIELDS = {User: 'profile_image', Post: 'post_image'}
+# User columns no post payload shows
+PRIVATE_USER_FIELDS = {'password', 'last_login', 'token_version', 'follower_count'}
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    # A new unmoderated post is not in the public feed yet; any other write
+    # may change which posts the feed holds or their order.
+    invalidate_post(instance.pk, feed=instance.moderated or not created)
+    if instance.moderated and created:
+        timelines.fan_out([instance.pk])
+        events.posts_published([instance.pk])
+    elif not instance.moderated and not created:
+        # Unpublished after the fact, e.g. by an edit
+        timelines.retract([instance.pk])
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    invalidate_post(instance.pk, feed=True)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    invalidate_post(instance.post_id)
+
+
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=Post)
+def image_replaced(sender, instance, **kwargs):
+    # A newly assigned upload hasn't been written to storage yet
+    field_name = IMAGE_FIELDS[sender]
+    field_file = getattr(instance, field_name)
+    instance._image_uploaded = bool(field_file) and not field_file._committed
+    if instance._image_uploaded or not field_file:
+        setattr(instance, f'{field_name}_variants', {})
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Post)
+def schedule_image_variants(sender, instance, **kwargs):
+    if getattr(instance, '_image_uploaded', False):
+        instance._image_uploaded = False
+        images.schedule(sender, instance.pk, IMAGE_FIELDS[sender])
+
+
+def stored_media(sender, instance):
+    field_name = IMAGE_FIELDS[sender]
+    return media.stored_names(getattr(instance, field_name).name, getattr(instance, f'{field_name}_variants'))
+
+
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=Post)
+def remember_stored_media(sender, instance, update_fields=None, **kwargs):
+    field_name = IMAGE_FIELDS[sender]
+    instance._stored_media = set()
+    if instance._state.adding:
+        return
+    if update_fields is not None and not {field_name, f'{field_name}_variants'} & set(update_fields):
+        instance._stored_media = None
+        return
+    row = sender.objects.filter(pk=instance.pk).values_list(field_name, f'{field_name}_variants').first()
+    if row is not None:
+        instance._stored_media = media.stored_names(*row)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Post)
+def count_media_refs(sender, instance, **kwargs):
+    before = instance.__dict__.pop('_stored_media', None)
+    if before is None:
+        return
+    after = stored_media(sender, instance)
+    media.retain(after - before)
+    media.release(before - after)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Post)
+def release_media(sender, instance, **kwargs):
+    media.release(stored_media(sender, instance))
+
+
+@receiver(post_delete, sender=ArchivedPost)
+def archived_post_deleted(sender, instance, **kwargs):
+    media.release(media.stored_names(instance.data.get('post_image'), instance.data.get('post_image_variants')))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    if getattr(instance, '_tokens_revoked', False):
+        forget_token_versions([instance.pk])
+    # Cached post payloads embed their author and moderator
+    if not created and not (update_fields and set(update_fields) <= PRIVATE_USER_FIELDS):
+        invalidate_user_posts(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    forget_token_versions([instance.pk])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # Group names are token claims, so membership changes revoke tokens
+    if action == 'pre_clear' and reverse:
+        instance._cleared_user_ids = list(instance.user_set.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action != 'post_clear' and not pk_set:
+        return
+    if not reverse:
+        user_ids = [instance.pk]
+    elif action == 'post_clear':
+        user_ids = instance.__dict__.pop('_cleared_user_ids', [])
+    else:
+        user_ids = list(pk_set)
+    if user_ids:
+        User.objects.filter(pk__in=user_ids).update(token_version=F('token_version') + 1)
+        forget_token_versions(user_ids)
+        if not reverse:
+            instance.refresh_from_db(fields=['token_version'])
+
+
+@receiver(pre_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # models.group_id caches name -> pk; drop it on rename or delete
+    if instance.pk is None:
+        return
+    if kwargs.get('signal') is pre_save:
+        previous = Group.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+        if previous is not None and previous != instance.name:
+            forget_group_id(previous)
+    else:
+        forget_group_id(instance.name)
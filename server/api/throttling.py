@@ -0,0 +1,123 @@
+"""
+Token-bucket throttles for the write-heavy endpoints, kept in the Django
+cache. Workers share the buckets only if they share the cache (REDIS_URL).
+With the default per-process LocMem cache each worker keeps its own, so
+the effective limit is the configured one times the number of workers.
+
+THROTTLE_BUCKETS maps a scope to the buckets a request has to pass:
+
+    'like': {'user': ('120/min', 30), 'ip': ('600/min', 100)}
+
+Each bucket refills at the given rate and holds at most the given burst.
+A bucket is keyed by the signed-in user, the client address, or the
+username in a login body. A rejected request gets a 429 with Retry-After
+and is counted on /metrics.
+
+Each bucket is a single cached "theoretical arrival time" (GCRA), so a
+check is one get and one set. The cache API has no compare-and-set, so
+concurrent requests can occasionally both pass on the last token. That
+is acceptable for load shedding.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+from . import metrics
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+
+def parse_rate(rate):
+    """'120/min' -> seconds between requests."""
+    count, period = rate.split('/')
+    return PERIODS[period] / int(count)
+
+
+def buckets(scope):
+    return getattr(settings, 'THROTTLE_BUCKETS', {}).get(scope, {})
+
+
+def check(key, interval, burst, now):
+    """(seconds to wait or 0, the bucket's new arrival time if a token is spent)."""
+    arrival = max(cache.get(key, now), now) + interval
+    return max(arrival - now - interval * burst, 0), arrival
+
+
+def spend(key, arrival, now):
+    cache.set(key, arrival, int(arrival - now) + 1)
+
+
+def take(key, interval, burst):
+    """Spend a token from the bucket at ``key``; return 0 or the seconds to wait."""
+    now = time.time()
+    wait, arrival = check(key, interval, burst, now)
+    if not wait:
+        spend(key, arrival, now)
+    return wait
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Passes a request only if every bucket configured for ``scope`` has room."""
+    scope = None
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def get_idents(self, request, view):
+        idents = {'ip': self.get_ident(request)}
+        if request.user and request.user.is_authenticated:
+            idents['user'] = request.user.pk
+        return idents
+
+    def allow_request(self, request, view):
+        idents = self.get_idents(request, view)
+        now = time.time()
+        passed = []
+        # Check every bucket before spending from any, so a request one
+        # bucket rejects costs the others nothing
+        for kind, (rate, burst) in buckets(self.scope).items():
+            ident = idents.get(kind)
+            if ident is None:
+                continue
+            digest = hashlib.sha1(str(ident).encode()).hexdigest()
+            key = f'throttle:{self.scope}:{kind}:{digest}'
+            wait, arrival = check(key, parse_rate(rate), burst, now)
+            if wait:
+                self.wait_seconds = wait
+                metrics.registry.count('throttled_requests', scope=self.scope, bucket=kind)
+                return False
+            passed.append((key, arrival))
+        for key, arrival in passed:
+            spend(key, arrival, now)
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class LikeThrottle(TokenBucketThrottle):
+    scope = 'like'
+
+
+class CommentThrottle(TokenBucketThrottle):
+    scope = 'comment'
+
+
+class BulkCommentThrottle(TokenBucketThrottle):
+    """One token per bulk request, from buckets sized for whole batches."""
+    scope = 'comment_bulk'
+
+
+class TokenThrottle(TokenBucketThrottle):
+    """Login and refresh, keyed by address and by the username being tried."""
+    scope = 'token'
+
+    def get_idents(self, request, view):
+        idents = {'ip': self.get_ident(request)}
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        if isinstance(username, str) and username:
+            idents['username'] = username.lower()
+        return idents
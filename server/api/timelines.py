@@ -0,0 +1,134 @@
+"""
+Following feed: the moderated posts of the authors a user follows.
+
+Most authors are fanned out on write. When one of their posts is
+approved, a TimelineEntry is written for every follower, so reading a
+page is one range scan of ``timeline_owner_idx``. Authors with at least
+TIMELINE_FANOUT_LIMIT followers are fanned in on read instead. Their
+posts are read from ``post_author_feed_idx`` and merged into the page,
+so one approval never writes millions of rows.
+
+Following someone copies up to TIMELINE_BACKFILL_POSTS of their latest
+posts into the new follower's timeline. ``manage.py build_timelines``
+rebuilds timelines and follower counts for existing data, for example
+after an author crosses the fan-out limit in either direction.
+"""
+import heapq
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from .models import Follow, Post, TimelineEntry, User
+
+# Timeline rows per INSERT
+WRITE_BATCH_SIZE = 1000
+
+
+def fanout_limit():
+    return getattr(settings, 'TIMELINE_FANOUT_LIMIT', 10000)
+
+
+def backfill_posts():
+    return getattr(settings, 'TIMELINE_BACKFILL_POSTS', 100)
+
+
+def write_entries(entries):
+    # A post can reach a timeline twice (follow backfill, re-approval)
+    TimelineEntry.objects.bulk_create(entries, batch_size=WRITE_BATCH_SIZE, ignore_conflicts=True)
+
+
+def latest_posts(author_id, limit):
+    return list(
+        Post.objects.filter(author_id=author_id, moderated=True)
+        .order_by('-create_date', '-id').values_list('pk', 'create_date')[:limit]
+    )
+
+
+def follow(follower_id, followee_id):
+    """Returns False if the follow already existed."""
+    with transaction.atomic():
+        _, created = Follow.objects.get_or_create(follower_id=follower_id, followee_id=followee_id)
+        if not created:
+            return False
+        User.objects.filter(pk=followee_id).update(follower_count=F('follower_count') + 1)
+        if User.objects.filter(pk=followee_id, follower_count__lt=fanout_limit()).exists():
+            write_entries(
+                TimelineEntry(owner_id=follower_id, post_id=post_id, create_date=create_date)
+                for post_id, create_date in latest_posts(followee_id, backfill_posts())
+            )
+    return True
+
+
+def unfollow(follower_id, followee_id):
+    """Returns False if there was no follow to remove."""
+    with transaction.atomic():
+        deleted, _ = Follow.objects.filter(follower_id=follower_id, followee_id=followee_id).delete()
+        if not deleted:
+            return False
+        User.objects.filter(pk=followee_id).update(follower_count=F('follower_count') - 1)
+        TimelineEntry.objects.filter(owner_id=follower_id, post__author_id=followee_id).delete()
+    return True
+
+
+def fan_out(post_ids):
+    """Copy the moderated posts among ``post_ids`` into their authors' followers' timelines."""
+    posts = (
+        Post.objects.filter(pk__in=post_ids, moderated=True, author__follower_count__lt=fanout_limit())
+        .order_by('author_id').values_list('author_id', 'pk', 'create_date')
+    )
+    for author_id, rows in groupby(posts, key=lambda row: row[0]):
+        rows = list(rows)
+        followers = (
+            Follow.objects.filter(followee_id=author_id)
+            .values_list('follower_id', flat=True).iterator(chunk_size=WRITE_BATCH_SIZE)
+        )
+        write_entries(
+            TimelineEntry(owner_id=follower_id, post_id=post_id, create_date=create_date)
+            for follower_id in followers
+            for _, post_id, create_date in rows
+        )
+
+
+def retract(post_ids):
+    """Drop posts that are no longer public from every timeline."""
+    TimelineEntry.objects.filter(post_id__in=post_ids).delete()
+
+
+def _before(position, date_field, id_field):
+    if position is None:
+        return Q()
+    create_date, post_id = position
+    return Q(**{f'{date_field}__lt': create_date}) | Q(**{date_field: create_date, f'{id_field}__lt': post_id})
+
+
+def page(user_id, after, limit):
+    """
+    Up to ``limit`` (create_date, post_id) pairs, newest first, that come
+    after the ``after`` pair.
+    """
+    sources = [list(
+        TimelineEntry.objects.filter(_before(after, 'create_date', 'post_id'), owner_id=user_id)
+        .order_by('-create_date', '-post_id').values_list('create_date', 'post_id')[:limit]
+    )]
+    fanned_in = Follow.objects.filter(
+        follower_id=user_id, followee__follower_count__gte=fanout_limit()
+    ).values_list('followee_id', flat=True)
+    for author_id in fanned_in:
+        # One query per author keeps each an index range scan
+        sources.append(list(
+            Post.objects.filter(_before(after, 'create_date', 'id'), author_id=author_id, moderated=True)
+            .order_by('-create_date', '-id').values_list('create_date', 'id')[:limit]
+        ))
+
+    rows, seen = [], set()
+    for row in heapq.merge(*sources, reverse=True):
+        # Posts written out before their author crossed the limit
+        if row[1] in seen:
+            continue
+        seen.add(row[1])
+        rows.append(row)
+        if len(rows) == limit:
+            break
+    return rows
@@ -1,7 +1,10 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from .views import UserViewSet, PostViewSet, CommentViewSet
+from .async_views import event_stream
+from .throttling import TokenThrottle
+from .views import UserViewSet, PostViewSet, CommentViewSet, cache_stats
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet)
@@ -10,6 +13,14 @@ router.register(r'comments', CommentViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
-    path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
-] 
\ No newline at end of file
+    path('token/', TokenObtainPairView.as_view(throttle_classes=[TokenThrottle]), name='token_obtain_pair'),
+    path('token/refresh/', TokenRefreshView.as_view(throttle_classes=[TokenThrottle]), name='token_refresh'),
+    path('cache/stats/', cache_stats, name='cache_stats'),
+    path('events/', event_stream, name='event_stream'),
+] 
+
+if settings.ASYNC_READ_VIEWS:
+    # ASGI mode: async GET handlers for the read-heavy endpoints take
+    # precedence over the router's routes for the same URLs.
+    from .async_views import urlpatterns as async_urlpatterns
+    urlpatterns = async_urlpatterns + urlpatterns
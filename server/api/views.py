@@ -1,95 +1,388 @@
 from django.shortcuts import render
 from rest_framework import viewsets, permissions, status
-from rest_framework.decorators import action
+from collections import OrderedDict
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ParseError
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
-from .models import Post, Comment
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.http import Http404
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from .models import Post, Comment, PostLike
 from .serializers import UserSerializer, PostSerializer, CommentSerializer
-from .permissions import IsAuthorOrReadOnly, IsModeratorOrReadOnly, IsAdminOrReadOnly
+from .authentication import user_instance
+from .fieldsets import FieldSpec, shape_queryset
+from .permissions import IsAuthorOrReadOnly, IsModeratorOrReadOnly, IsAdminOrReadOnly, is_moderator
+from .pagination import (
+    CommentPagination, ModerationQueuePagination, PostPagination, SearchPagination, TimelinePagination,
+    UserPagination, post_pagination,
+)
+from .search import search_posts
+from .throttling import BulkCommentThrottle, CommentThrottle, LikeThrottle
+from . import archive, bulk, cache, events, likes, moderation, timelines
+from .conditional import (
+    me_etag, me_last_modified, post_comments_etag, post_comments_last_modified,
+    post_detail_etag, post_detail_last_modified, post_detail_version, post_list_etag, post_list_last_modified,
+    post_list_versions,
+)
 
 User = get_user_model()
 
+# GET/HEAD answer 304 when If-None-Match / If-Modified-Since still match;
+# writes are refused with 412 when If-Match names a stale ETag.
+post_list_condition = method_decorator(condition(post_list_etag, post_list_last_modified))
+post_detail_condition = method_decorator(condition(post_detail_etag, post_detail_last_modified))
+post_comments_condition = method_decorator(condition(post_comments_etag, post_comments_last_modified))
+me_condition = method_decorator(condition(me_etag, me_last_modified))
+
+
+def with_post_relations(queryset):
+    # PostSerializer nests author and moderator, so join them up front
+    # instead of one query per row.
+    return queryset.select_related('author', 'moderator')
+
+
+def with_is_liked(queryset, user):
+    if not user.is_authenticated:
+        return queryset
+    return queryset.annotate(is_liked=Exists(
+        PostLike.objects.filter(post=OuterRef('pk'), user_id=user.pk)
+    ))
+
+def bulk_create_response(view, request, create, extra_context=None):
+    # A JSON list of create bodies; all of them are written or none are
+    items = request.data
+    if not isinstance(items, list):
+        return Response({'error': 'Expected a list of objects'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(items) > bulk.max_items():
+        return Response(
+            {'error': f'At most {bulk.max_items()} objects per request'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    validated, errors, invalid = bulk.validate(
+        view.get_serializer_class(), items,
+        {**view.get_serializer_context(), **(extra_context(items) if extra_context else {})}
+    )
+    if invalid:
+        return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+    created = create(user_instance(request.user), validated)
+    serializer = view.get_serializer(created, many=True)
+    return Response({'results': serializer.data}, status=status.HTTP_201_CREATED)
+
+def publish_comments(comments):
+    # The full representation, not the requester's ?fields= selection
+    for data in CommentSerializer(comments, many=True).data:
+        events.comment_created(data)
+
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = UserPagination
 
     def get_permissions(self):
         if self.action == 'create':
             return [permissions.AllowAny()]
         return super().get_permissions()
 
+    def get_queryset(self):
+        return shape_queryset(super().get_queryset(), self.get_serializer_class(), self.request)
+
     @action(detail=False, methods=['get'])
+    @me_condition
     def me(self, request):
-        serializer = self.get_serializer(request.user)
+        serializer = self.get_serializer(user_instance(request.user))
         return Response(serializer.data)
 
     @action(detail=False, methods=['post'], url_path='me/update')
+    @me_condition
     def update_me(self, request):
-        user = request.user
+        user = user_instance(request.user)
         serializer = self.get_serializer(user, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=True, methods=['post', 'delete'])
+    def follow(self, request, pk=None):
+        followee = self.get_object()
+        if followee.pk == request.user.pk:
+            return Response({'error': 'You cannot follow yourself'}, status=status.HTTP_400_BAD_REQUEST)
+        following = request.method == 'POST'
+        if following:
+            timelines.follow(request.user.pk, followee.pk)
+        else:
+            timelines.unfollow(request.user.pk, followee.pk)
+        followee.refresh_from_db(fields=['follower_count'])
+        return Response({'following': following, 'follower_count': followee.follower_count})
+
 class PostViewSet(viewsets.ModelViewSet):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
     permission_classes = [IsAuthorOrReadOnly]
+    pagination_class = PostPagination
+
+    def get_permissions(self):
+        # Anyone signed in may like a post, not just its author; the
+        # moderation actions check the user's role themselves.
+        if self.action in ('like', 'moderate', 'moderate_batch', 'claim', 'unmoderated', 'bulk', 'following'):
+            return [permissions.IsAuthenticated()]
+        return super().get_permissions()
+
+    def get_throttles(self):
+        if self.action == 'like':
+            return [LikeThrottle()]
+        return super().get_throttles()
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and self.action == 'list':
+            self._paginator = post_pagination(self.request)
+        return super().paginator
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        serializer.save(author=user_instance(self.request.user))
 
     def get_queryset(self):
         # Check if this is a moderation-specific request
         is_moderation_request = self.request.path.endswith('/moderate/') or self.request.path.endswith('/unmoderated/')
         
         # For moderation endpoints, show all posts to staff/moderators
-        if is_moderation_request and (self.request.user.is_staff or self.request.user.role == 'moderator'):
-            return Post.objects.all()
+        if is_moderation_request and is_moderator(self.request.user):
+            return with_is_liked(with_post_relations(Post.objects.all()), self.request.user)
             
         # For regular views (like home screen), only show moderated posts for everyone
-        return Post.objects.filter(moderated=True)
+        return with_is_liked(with_post_relations(Post.objects.filter(moderated=True)), self.request.user)
+
+    @post_list_condition
+    def list(self, request, *args, **kwargs):
+        # The public feed is served from the cache: each page stores only the
+        # ordered post ids, and post payloads are cached per post so a like
+        # or edit only invalidates that one post.
+        activity = request.query_params.get('ordering') == 'activity'
+        # Keyed by the rows the ETag was computed from, so the body served
+        # is never older than its validators
+        versions = post_list_versions(request)
+        page = cache.get_or_build(
+            cache.feed_page_key(request, activity, versions), lambda: self.build_feed_page(versions)
+        )
+        return Response(OrderedDict([
+            ('next', page['next']),
+            ('previous', page['previous']),
+            ('results', self.post_payloads(page['ids'], versions)),
+        ]))
+
+    def full_serializer(self, *args, **kwargs):
+        # Payloads shared through the cache are always complete; ?fields=
+        # and ?expand= are applied as they are read back (see sparse()).
+        context = dict(self.get_serializer_context(), fieldsets=False)
+        return self.get_serializer(*args, context=context, **kwargs)
+
+    def sparse(self, items):
+        spec = FieldSpec.from_request(self.request)
+        return [spec.trim(item, PostSerializer) for item in items]
+
+    def post_payloads(self, post_ids, versions=None):
+        # Serialized posts in post_ids order, from the cache where possible
+        found, missing = cache.get_post_payloads(post_ids, versions)
+        if missing:
+            posts = with_post_relations(Post.objects.filter(pk__in=missing))
+            fresh = {item['id']: item for item in self.full_serializer(posts, many=True).data}
+            cache.set_post_payloads(fresh, versions)
+            found.update(fresh)
+        results = [found[post_id] for post_id in post_ids if post_id in found]
+        return self.sparse(self.apply_is_liked(results))
+
+    def build_feed_page(self, versions=None):
+        queryset = with_post_relations(Post.objects.filter(moderated=True))
+        posts = self.paginate_queryset(queryset)
+        payloads = {item['id']: item for item in self.full_serializer(posts, many=True).data}
+        cache.set_post_payloads(payloads, versions)
+        return {
+            'ids': list(payloads),
+            'next': self.paginator.get_next_link(),
+            'previous': self.paginator.get_previous_link(),
+        }
+
+    @post_detail_condition
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            post_id = int(kwargs['pk'])
+        except ValueError:
+            return super().retrieve(request, *args, **kwargs)
+
+        def build():
+            try:
+                post = self.get_object()
+            except Http404:
+                # Old posts are moved out by archive_content but stay readable
+                post = archive.archived_post(post_id)
+                if post is None:
+                    raise
+            data = self.full_serializer(post).data
+            return dict(data, is_liked=False)
+
+        key = cache.post_payload_keys([post_id], {post_id: post_detail_version(request, kwargs['pk'])})[post_id]
+        data = cache.get_or_build(key, build)
+        return Response(self.sparse(self.apply_is_liked([data]))[0])
+
+    @post_detail_condition
+    def update(self, request, *args, **kwargs):
+        return super().update(request, *args, **kwargs)
+
+    @post_detail_condition
+    def destroy(self, request, *args, **kwargs):
+        return super().destroy(request, *args, **kwargs)
+
+    def apply_is_liked(self, items):
+        # Cached payloads are shared by every viewer, so is_liked is filled
+        # in per request with one indexed lookup.
+        user = self.request.user
+        if not user.is_authenticated or not items:
+            return items
+        liked = set(PostLike.objects.filter(
+            user_id=user.pk, post_id__in=[item['id'] for item in items]
+        ).values_list('post_id', flat=True))
+        return [dict(item, is_liked=item['id'] in liked) for item in items]
 
     @action(detail=False, methods=['get'])
     def unmoderated(self, request):
-        if request.user.role != 'moderator' and request.user.role != 'admin':
+        # The moderation queue: pending posts not leased to someone else,
+        # oldest first.
+        if not is_moderator(request.user):
             return Response(
                 {'error': 'Only moderators can view unmoderated posts'},
                 status=status.HTTP_403_FORBIDDEN
             )
-        unmoderated_posts = Post.objects.filter(moderated=False)
-        serializer = self.get_serializer(unmoderated_posts, many=True)
-        return Response(serializer.data)
+        paginator = ModerationQueuePagination()
+        page = paginator.paginate_queryset(
+            with_is_liked(shape_queryset(moderation.queue(request.user), PostSerializer, request), request.user),
+            request, view=self,
+        )
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['post', 'delete'])
+    def claim(self, request):
+        # POST {"limit": n} leases the n oldest available posts to this
+        # moderator; DELETE hands back everything they hold.
+        if not is_moderator(request.user):
+            return Response(
+                {'error': 'Only moderators can moderate posts'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        if request.method == 'DELETE':
+            return Response({'released': moderation.release(request.user)})
+        try:
+            limit = min(int(request.data.get('limit', 20)), moderation.max_batch_size())
+        except (TypeError, ValueError):
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        expires = moderation.claim(request.user, max(limit, 0))
+        claimed = with_post_relations(
+            moderation.pending().filter(claimed_by_id=request.user.pk)
+        ).order_by('create_date', 'id')
+        return Response({
+            'claim_expires': expires,
+            'results': self.get_serializer(claimed, many=True).data,
+        })
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        query = request.query_params.get('q', '')
+        paginator = SearchPagination()
+        post_ids = paginator.paginate_search(search_posts, query, request)
+        return paginator.get_paginated_response(self.post_payloads(post_ids))
+
+    @action(detail=False, methods=['get'])
+    def following(self, request):
+        # Posts by the authors this user follows, newest first
+        paginator = TimelinePagination()
+        post_ids = paginator.paginate_timeline(timelines.page, request.user.pk, request)
+        return paginator.get_paginated_response(self.post_payloads(post_ids))
+
+    @action(detail=True, methods=['get'])
+    @post_comments_condition
+    def comments(self, request, pk=None):
+        try:
+            queryset = Comment.objects.filter(post=self.get_object())
+        except Http404:
+            queryset = archive.archived_comments(pk) if pk.isdigit() else None
+            if queryset is None:
+                raise
+        paginator = CommentPagination()
+        page = paginator.paginate_queryset(
+            shape_queryset(queryset, CommentSerializer, request), request, view=self
+        )
+        serializer = CommentSerializer(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['post'])
     def moderate(self, request, pk=None):
-        post = self.get_object()
-        if request.user.role != 'moderator' and request.user.role != 'admin':
+        if not is_moderator(request.user):
             return Response(
                 {'error': 'Only moderators can moderate posts'},
                 status=status.HTTP_403_FORBIDDEN
             )
-        post.moderated = True
-        post.moderator = request.user
-        post.save()
-        return Response({'status': 'post moderated'})
-        
+        try:
+            post_id = int(pk)
+        except ValueError:
+            raise Http404
+        approve = request.data.get('action', 'approve') != 'reject'
+        if not moderation.moderate(request.user, [post_id], approve):
+            # Nothing pending was updated: either it is already in the
+            # requested state, or another moderator holds it.
+            post = self.get_object()
+            if post.moderated != approve or post.rejected == approve:
+                return Response(
+                    {'error': 'Post is already moderated or claimed by another moderator'},
+                    status=status.HTTP_409_CONFLICT
+                )
+        return Response({'status': 'post moderated' if approve else 'post rejected'})
+
+    @action(detail=False, methods=['post'], url_path='moderate')
+    def moderate_batch(self, request):
+        # {"ids": [...], "action": "approve" | "reject"}, one UPDATE for all
+        if not is_moderator(request.user):
+            return Response(
+                {'error': 'Only moderators can moderate posts'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        ids = request.data.get('ids')
+        action = request.data.get('action', 'approve')
+        if (
+            not isinstance(ids, list)
+            or not all(isinstance(post_id, int) for post_id in ids)
+            or action not in ('approve', 'reject')
+        ):
+            return Response(
+                {'error': 'Expected a list of post ids and an action of approve or reject'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(ids) > moderation.max_batch_size():
+            return Response(
+                {'error': f'At most {moderation.max_batch_size()} posts per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        updated = moderation.moderate(request.user, ids, action == 'approve')
+        return Response({'status': f'posts {action}d', 'updated': updated, 'skipped': len(ids) - updated})
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        return bulk_create_response(self, request, bulk.create_posts)
+
     @action(detail=True, methods=['post'])
     def like(self, request, pk=None):
         post = self.get_object()
         action = request.data.get('action', 'like')
-        
-        if action == 'like':
-            post.like_count += 1
-        elif action == 'dislike' and post.like_count > 0:
-            post.like_count -= 1
-            
-        post.save()
+        like_count = post.like_count
+        if action in ('like', 'dislike'):
+            _, like_count = likes.toggle(post, request.user, action == 'like')
         return Response({
-            'status': f'post {action}d', 
-            'like_count': post.like_count,
+            'status': f'post {action}d',
+            'like_count': like_count,
             'is_liked': action == 'like'
         })
 
@@ -97,6 +390,60 @@ class CommentViewSet(viewsets.ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = CommentPagination
+
+    def get_throttles(self):
+        if self.action == 'create':
+            return [CommentThrottle()]
+        if self.action == 'bulk':
+            return [BulkCommentThrottle()]
+        return super().get_throttles()
+
+    def get_queryset(self):
+        queryset = shape_queryset(super().get_queryset(), self.get_serializer_class(), self.request)
+        post_id = self.request.query_params.get('post')
+        if post_id is not None and self.action == 'list':
+            if not post_id.isdigit():
+                raise ParseError('post must be a post id')
+            queryset = queryset.filter(post_id=post_id)
+        return queryset
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            comment = archive.archived_comment(kwargs['pk']) if kwargs['pk'].isdigit() else None
+            if comment is None:
+                raise
+            return Response(self.get_serializer(comment).data)
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        # The post's counters move in the same transaction as the comment
+        with transaction.atomic():
+            comment = serializer.save(author=user_instance(self.request.user))
+            Post.comment_added(comment.post_id, comment.create_date)
+            publish_comments([comment])
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            Post.comment_removed(instance.post_id)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        # One query for every post the batch comments on
+        def create(author, validated):
+            comments = bulk.create_comments(author, validated)
+            publish_comments(comments)
+            return comments
+
+        return bulk_create_response(
+            self, request, create,
+            lambda items: {'preloaded': {Post: bulk.preload_posts(items)}},
+        )
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def cache_stats(request):
+    return Response(cache.get_stats())
@@ -0,0 +1,178 @@
+"""
+Compare the WSGI (gthread) and ASGI (uvicorn + async read views) serving
+modes under the same read load and the same number of worker processes.
+
+    cd server && python -m benchmarks.compare_servers --workers 2 --duration 20
+
+Seeds a throwaway SQLite database, then starts gunicorn once per mode.
+Concurrent clients cycle through the feed, post detail, comments and
+users/me. The script reports throughput, latency percentiles and the
+combined RSS of the gunicorn processes.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(posts, comments_per_post):
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from api.authentication import ClaimsRefreshToken
+    from api.models import User, Post, Comment
+
+    call_command('migrate', verbosity=0)
+    users = User.objects.bulk_create(User(username=f'user{i}') for i in range(50))
+    Post.objects.bulk_create(
+        Post(title=f'Post {i}', content='lorem ipsum ' * 40, author=random.choice(users), moderated=True)
+        for i in range(posts)
+    )
+    post_ids = list(Post.objects.values_list('id', flat=True))
+    Comment.objects.bulk_create(
+        Comment(post_id=post_id, author=random.choice(users), content='nice post')
+        for post_id in post_ids for _ in range(comments_per_post)
+    )
+    return post_ids, str(ClaimsRefreshToken.for_user(users[0]).access_token)
+
+
+def rss_kb(pid):
+    # Resident memory of the gunicorn master plus its workers
+    total = 0
+    pids = [str(pid)] + subprocess.run(
+        ['pgrep', '-P', str(pid)], capture_output=True, text=True
+    ).stdout.split()
+    for child in pids:
+        try:
+            with open(f'/proc/{child}/status') as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except FileNotFoundError:
+            pass
+    return total
+
+
+def wait_for(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/posts/')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+
+def load(port, token, post_ids, concurrency, duration):
+    paths = ['/api/posts/', '/api/users/me/']
+    paths += [f'/api/posts/{pk}/' for pk in post_ids[:20]]
+    paths += [f'/api/posts/{pk}/comments/' for pk in post_ids[:20]]
+    headers = {'Authorization': f'Bearer {token}'}
+    latencies, errors = [], []
+    deadline = time.time() + duration
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        while time.time() < deadline:
+            path = random.choice(paths)
+            started = time.perf_counter()
+            try:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors.append(response.status)
+            except (OSError, http.client.HTTPException) as exc:
+                errors.append(type(exc).__name__)
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def run_mode(mode, args, env, post_ids, token):
+    app = 'server.asgi:application' if mode == 'asgi' else 'server.wsgi:application'
+    port = args.port
+    server_env = dict(env, SERVER_MODE=mode, WEB_CONCURRENCY=str(args.workers),
+                      WSGI_THREADS=str(args.threads), BIND=f'127.0.0.1:{port}')
+    server_env.pop('ASYNC_READ_VIEWS', None)
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', app, '-c', 'gunicorn.conf.py', '--access-logfile', '/dev/null'],
+        cwd=SERVER_DIR, env=server_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for(port)
+        load(port, token, post_ids, args.concurrency, 2)  # warm up
+        latencies, errors = load(port, token, post_ids, args.concurrency, args.duration)
+        memory = rss_kb(proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait()
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0
+
+    return {
+        'mode': mode,
+        'workers': args.workers,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / args.duration, 1),
+        'p50_ms': round(pct(0.50), 2),
+        'p95_ms': round(pct(0.95), 2),
+        'p99_ms': round(pct(0.99), 2),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 2) if latencies else 0,
+        'rss_mb': round(memory / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4, help='threads per WSGI worker')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=int, default=15)
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--comments', type=int, default=5)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='benchmarks.settings',
+               BENCH_DB=os.path.join(workdir, 'bench.sqlite3'))
+    os.environ.update(env)
+    sys.path.insert(0, SERVER_DIR)
+    post_ids, token = seed(args.posts, args.comments)
+
+    results = [run_mode(mode, args, env, post_ids, token) for mode in ('wsgi', 'asgi')]
+    columns = ['mode', 'workers', 'requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms', 'rss_mb']
+    print(' '.join(f'{name:>9}' for name in columns))
+    for row in results:
+        print(' '.join(f'{row[name]:>9}' for name in columns))
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
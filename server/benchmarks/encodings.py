@@ -0,0 +1,113 @@
+"""
+Payload size and encode time of a feed page in each response encoding:
+JSON or MessagePack, nested or ``?shape=normalized``, and each of those
+uncompressed, gzip and brotli at the levels api/compression.py uses.
+
+    cd server && python -m benchmarks.encodings --rows 20 100 1000
+
+Seeds a throwaway SQLite database with 200 authors and posts of varied
+text (repeated filler would compress unrealistically well), then times
+rendering and compressing each page. Serialization itself is the same
+for every encoding and is not included.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+
+from benchmarks.serialization import SERVER_DIR, timed
+
+AUTHORS = 200
+ENCODINGS = [
+    ('json', 'api.renderers.FastJSONRenderer', False),
+    ('json normalized', 'api.renderers.FastJSONRenderer', True),
+    ('msgpack', 'api.renderers.MessagePackRenderer', False),
+    ('msgpack normalized', 'api.renderers.MessagePackRenderer', True),
+]
+
+
+def seed(rows):
+    from django.core.management import call_command
+    from api.models import User, Post
+
+    call_command('migrate', verbosity=0)
+    rng = random.Random(0)
+    # A vocabulary of made-up words, so text neither repeats nor is noise
+    words = [''.join(rng.choice('etaoinshrdlucmfwypvbgk') for _ in range(rng.randint(2, 9))) for _ in range(5000)]
+
+    def text(low, high):
+        return ' '.join(rng.choice(words) for _ in range(rng.randint(low, high)))
+
+    users = User.objects.bulk_create(
+        User(username=f'user{i}', email=f'user{i}@example.com', bio=text(5, 30), age=rng.randint(16, 80))
+        for i in range(AUTHORS)
+    )
+    # Like real feeds, a few authors write most of the posts
+    authors = rng.choices(users, weights=[1 / (rank + 1) for rank in range(AUTHORS)], k=rows)
+    Post.objects.bulk_create(
+        Post(title=text(2, 8), content=text(20, 120), author=author, moderator=rng.choice(users[:5]),
+             moderated=True, like_count=rng.randint(0, 500), comment_count=rng.randint(0, 40))
+        for author in authors
+    )
+
+
+def measure(rows, repeat):
+    from django.test import RequestFactory
+    from django.utils.module_loading import import_string
+    from rest_framework.request import Request
+    from api import compression
+    from api.models import Post
+    from api.serializers import PostSerializer
+
+    posts = list(Post.objects.select_related('author', 'moderator').order_by('-create_date', '-id')[:rows])
+    results = []
+    for name, renderer_path, normalized in ENCODINGS:
+        request = Request(RequestFactory().get('/api/posts/', {'shape': 'normalized'} if normalized else {}))
+        data = {'next': None, 'previous': None,
+                'results': PostSerializer(posts, many=True, context={'request': request}).data}
+        renderer = import_string(renderer_path)()
+        encode, body = timed(lambda: renderer.render(data, renderer_context={'request': request}), repeat)
+        gzip_time, gzipped = timed(lambda: compression.compress(body, 'gzip'), repeat)
+        br_time, brotlied = timed(lambda: compression.compress(body, 'br'), repeat)
+        results.append({
+            'rows': rows,
+            'encoding': name,
+            'bytes': len(body),
+            'gzip_bytes': len(gzipped),
+            'br_bytes': len(brotlied),
+            'encode_ms': round(encode * 1000, 2),
+            'gzip_ms': round(gzip_time * 1000, 2),
+            'br_ms': round(br_time * 1000, 2),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[20, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=5, help='best of N runs')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    os.environ.update(DJANGO_SETTINGS_MODULE='benchmarks.settings',
+                      BENCH_DB=os.path.join(workdir, 'bench.sqlite3'), FAST_SERIALIZATION='1')
+    sys.path.insert(0, SERVER_DIR)
+    import django
+    django.setup()
+    seed(max(args.rows))
+
+    results = [row for rows in args.rows for row in measure(rows, args.repeat)]
+    columns = ['rows', 'encoding', 'bytes', 'gzip_bytes', 'br_bytes', 'encode_ms', 'gzip_ms', 'br_ms']
+    print(' '.join(f'{name:>18}' for name in columns))
+    for row in results:
+        print(' '.join(f'{row[name]:>18}' for name in columns))
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
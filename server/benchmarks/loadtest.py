@@ -0,0 +1,352 @@
+"""
+Load-test the API with scripted workloads against a local gunicorn.
+
+    cd server && python -m benchmarks.loadtest --scale 1k --json before.json
+    cd server && python -m benchmarks.loadtest --scale 1k --compare before.json
+
+Seeds a SQLite database at the chosen scale, or reuses the one left by an
+earlier run. It then starts gunicorn with REQUEST_METRICS=1 and runs each
+workload in turn: concurrent clients repeat the workload's script for
+--duration seconds.
+
+For each workload, and for each request in its script, the report gives
+throughput and p50/p95/p99 latency. Database queries per request are
+read from the server's request log. --compare flags any step that got
+slower, lost throughput or runs more queries than in an earlier --json
+file. The script exits with status 1 if any step regressed.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from benchmarks.compare_servers import SERVER_DIR, wait_for
+
+# Posts seeded at each scale; users and comments scale with them
+SCALES = {
+    '1k': 1_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+}
+COMMENTS_PER_POST = 3
+PENDING_SHARE = 10  # one post in ten awaits moderation
+PASSWORD = 'benchmark-password'
+SEED_BATCH = 5000
+WORKLOADS = ('browse', 'like', 'comment', 'moderate', 'login')
+
+
+def user_count(posts):
+    return max(100, posts // 10)
+
+
+def seed(posts):
+    from django.contrib.auth.hashers import make_password
+    from django.core.management import call_command
+    from django.utils import timezone
+    from api.models import AUTHORS_GROUP, Comment, Post, User, group_id
+
+    call_command('migrate', verbosity=0)
+    if Post.objects.count() >= posts:
+        return
+    users = user_count(posts)
+    # One hash for everyone; hashing a million passwords would take hours
+    password = make_password(PASSWORD)
+    for start in range(0, users, SEED_BATCH):
+        created = User.objects.bulk_create(
+            User(username=f'user{i}', email=f'user{i}@example.com', password=password,
+                 role='moderator' if i % 50 == 0 else 'author')
+            for i in range(start, min(users, start + SEED_BATCH))
+        )
+        User.groups.through.objects.bulk_create(
+            User.groups.through(user_id=user.pk, group_id=group_id(AUTHORS_GROUP)) for user in created
+        )
+    user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+
+    now = timezone.now()
+    for start in range(0, posts, SEED_BATCH):
+        batch = []
+        for i in range(start, min(posts, start + SEED_BATCH)):
+            created = now - timedelta(minutes=10 * (posts - i))
+            moderated = i % PENDING_SHARE != 0
+            batch.append(Post(
+                title=f'Post {i}', content='lorem ipsum dolor sit amet ' * 12,
+                author_id=user_ids[i % len(user_ids)], moderated=moderated, create_date=created,
+                comment_count=COMMENTS_PER_POST if moderated else 0,
+                last_activity_at=created + timedelta(minutes=COMMENTS_PER_POST if moderated else 0),
+            ))
+        Post.objects.bulk_create(batch)
+        Comment.objects.bulk_create(
+            Comment(post_id=post.pk, author_id=user_ids[(post.pk + j) % len(user_ids)],
+                    content='nice post', create_date=post.create_date + timedelta(minutes=j + 1))
+            for post in batch if post.moderated for j in range(COMMENTS_PER_POST)
+        )
+        print(f'seeded {min(posts, start + SEED_BATCH)}/{posts} posts', file=sys.stderr)
+
+
+def fixtures(clients):
+    """Access tokens and ids the workloads need, made fresh for each run."""
+    from api.authentication import ClaimsRefreshToken
+    from api.models import Post, User
+
+    users = list(User.objects.filter(role='author').order_by('pk')[:clients])
+    moderators = list(User.objects.filter(role='moderator').order_by('pk')[:clients])
+    return {
+        'users': [(user.username, str(ClaimsRefreshToken.for_user(user).access_token)) for user in users],
+        'moderators': [str(ClaimsRefreshToken.for_user(user).access_token) for user in moderators],
+        'post_ids': list(Post.objects.filter(moderated=True).order_by('-create_date').values_list('pk', flat=True)[:1000]),
+    }
+
+
+class Session:
+    """One client connection; records every request under a step name."""
+
+    def __init__(self, port, token, samples):
+        self.port, self.token, self.samples = port, token, samples
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+
+    def request(self, step, method, path, body=None, auth=True, expect=(200, 201)):
+        headers = {'Content-Type': 'application/json'}
+        if auth:
+            headers['Authorization'] = f'Bearer {self.token}'
+        payload = json.dumps(body) if body is not None else None
+        started = time.perf_counter()
+        try:
+            self.conn.request(method, path, body=payload, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+            self.samples[step].append((None, False))
+            return None
+        self.samples[step].append((time.perf_counter() - started, response.status in expect))
+        if response.status in (200, 201) and data:
+            return json.loads(data)
+        return None
+
+
+def path_of(url):
+    return url[url.index('/api/'):] if url else None
+
+
+def browse(session, data):
+    page = session.request('feed', 'GET', '/api/posts/')
+    for _ in range(2):
+        if not page or not page.get('next'):
+            break
+        page = session.request('feed_next', 'GET', path_of(page['next']))
+    post_id = random.choice(data['post_ids'])
+    session.request('detail', 'GET', f'/api/posts/{post_id}/')
+    session.request('comments', 'GET', f'/api/posts/{post_id}/comments/')
+
+
+def like(session, data):
+    action = random.choice(('like', 'dislike'))
+    session.request('like', 'POST', f'/api/posts/{random.choice(data["post_ids"])}/like/', {'action': action})
+
+
+def comment(session, data):
+    session.request('comment', 'POST', '/api/comments/',
+                    {'post': random.choice(data['post_ids']), 'content': 'benchmark comment'})
+
+
+def moderate(session, data):
+    page = session.request('queue', 'GET', '/api/posts/unmoderated/?page_size=5')
+    for post in (page or {}).get('results', [])[:1]:
+        # Another moderator may approve it first
+        session.request('moderate', 'POST', f'/api/posts/{post["id"]}/moderate/', {'action': 'approve'},
+                        expect=(200, 409))
+
+
+def login(session, data):
+    session.request('login', 'POST', '/api/token/', {'username': session.username, 'password': PASSWORD},
+                    auth=False)
+
+
+SCRIPTS = {'browse': browse, 'like': like, 'comment': comment, 'moderate': moderate, 'login': login}
+
+
+def run_workload(name, port, data, concurrency, duration):
+    samples = defaultdict(list)
+    deadline = time.time() + duration
+
+    def client(i):
+        if name == 'moderate':
+            session = Session(port, data['moderators'][i % len(data['moderators'])], samples)
+        else:
+            username, token = data['users'][i % len(data['users'])]
+            session = Session(port, token, samples)
+            session.username = username
+        while time.time() < deadline:
+            SCRIPTS[name](session, data)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else 0
+
+
+def summarize(samples, duration):
+    steps = {}
+    for step, results in sorted(samples.items()):
+        latencies = sorted(latency for latency, _ in results if latency is not None)
+        steps[step] = {
+            'requests': len(results),
+            'errors': sum(1 for latency, ok in results if not ok),
+            'rps': round(len(latencies) / duration, 1),
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+        }
+    return steps
+
+
+def query_counts(log_path, start):
+    """Mean DB queries per request by view, from the api.requests log lines written after ``start``."""
+    totals = defaultdict(lambda: [0, 0])
+    with open(log_path) as log:
+        log.seek(start)
+        for line in log:
+            if not line.startswith('{'):
+                continue
+            entry = json.loads(line)
+            if 'sql' in entry:  # the slow-request repeat of a line already counted
+                continue
+            total = totals[f'{entry["method"]} {entry["view"]}']
+            total[0] += 1
+            total[1] += entry['db_queries']
+    return {view: round(queries / count, 2) for view, (count, queries) in sorted(totals.items())}
+
+
+def start_server(args, env, log_path):
+    app = 'server.asgi:application' if args.mode == 'asgi' else 'server.wsgi:application'
+    server_env = dict(env, SERVER_MODE=args.mode, WEB_CONCURRENCY=str(args.workers),
+                      BIND=f'127.0.0.1:{args.port}', REQUEST_METRICS='1', SLOW_REQUEST_SECONDS='1000')
+    if args.mode == 'asgi':
+        server_env['ASYNC_READ_VIEWS'] = '1'
+    log = open(log_path, 'a')
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', app, '-c', 'gunicorn.conf.py', '--access-logfile', '/dev/null'],
+        cwd=SERVER_DIR, env=server_env, stdout=subprocess.DEVNULL, stderr=log,
+    )
+    return proc, log
+
+
+def git_commit():
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVER_DIR,
+                            capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def compare(results, baseline, threshold):
+    """Lines describing every step that is worse than ``baseline`` by more than ``threshold`` percent."""
+    regressions = []
+    for workload, current in results['workloads'].items():
+        previous = baseline.get('workloads', {}).get(workload)
+        if previous is None:
+            continue
+        for step, stats in current['steps'].items():
+            before = previous['steps'].get(step)
+            if before is None:
+                continue
+            for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+                if before[metric] and stats[metric] > before[metric] * (1 + threshold / 100):
+                    regressions.append(f'{workload}/{step}: {metric} {before[metric]} -> {stats[metric]}')
+            if before['rps'] and stats['rps'] < before['rps'] * (1 - threshold / 100):
+                regressions.append(f'{workload}/{step}: rps {before["rps"]} -> {stats["rps"]}')
+        for view, queries in current['queries_per_request'].items():
+            old = previous['queries_per_request'].get(view)
+            # Query counts are deterministic enough to flag any increase
+            if old is not None and queries > old + 0.5:
+                regressions.append(f'{workload}: {view} queries/request {old} -> {queries}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='1k')
+    parser.add_argument('--workloads', nargs='+', choices=WORKLOADS, default=list(WORKLOADS))
+    parser.add_argument('--mode', choices=('wsgi', 'asgi'), default='wsgi')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=int, default=20, help='seconds per workload')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--db', help='SQLite file to seed or reuse (default: one per scale in the temp dir)')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--compare', help='flag regressions against an earlier --json file')
+    parser.add_argument('--threshold', type=float, default=10, help='percent change counted as a regression')
+    args = parser.parse_args()
+
+    db = args.db or os.path.join(tempfile.gettempdir(), f'api-loadtest-{args.scale}.sqlite3')
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='benchmarks.settings', BENCH_DB=db)
+    os.environ.update(env)
+    sys.path.insert(0, SERVER_DIR)
+    import django
+    django.setup()
+    seed(SCALES[args.scale])
+    data = fixtures(args.concurrency)
+
+    log_path = os.path.join(tempfile.mkdtemp(prefix='loadtest-'), 'requests.log')
+    proc, log = start_server(args, env, log_path)
+    results = {
+        'meta': {
+            'commit': git_commit(), 'scale': args.scale, 'posts': SCALES[args.scale], 'mode': args.mode,
+            'workers': args.workers, 'concurrency': args.concurrency, 'duration': args.duration,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        },
+        'workloads': {},
+    }
+    try:
+        wait_for(args.port)
+        for name in args.workloads:
+            run_workload(name, args.port, data, args.concurrency, 2)  # warm up
+            log.flush()
+            start = os.path.getsize(log_path)
+            samples = run_workload(name, args.port, data, args.concurrency, args.duration)
+            time.sleep(0.5)  # let the workers flush their last log lines
+            steps = summarize(samples, args.duration)
+            results['workloads'][name] = {
+                'requests': sum(step['requests'] for step in steps.values()),
+                'rps': round(sum(step['rps'] for step in steps.values()), 1),
+                'steps': steps,
+                'queries_per_request': query_counts(log_path, start),
+            }
+    finally:
+        proc.terminate()
+        proc.wait()
+        log.close()
+
+    columns = ['requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms']
+    print(f'{"step":>20} ' + ' '.join(f'{name:>9}' for name in columns))
+    for name, workload in results['workloads'].items():
+        for step, stats in workload['steps'].items():
+            print(f'{name + "/" + step:>20} ' + ' '.join(f'{stats[column]:>9}' for column in columns))
+        for view, queries in workload['queries_per_request'].items():
+            print(f'{"":>20} {queries:>6} queries  {view}')
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare(results, json.load(baseline), args.threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Compare DRF serialization + JSONRenderer with the FAST_SERIALIZATION path
+(api/fastpath.py + orjson) on the feed payload.
+
+    cd server && python -m benchmarks.serialization --rows 100 1000 10000
+
+Seeds a throwaway SQLite database, loads each page of posts once, then
+times serializing and rendering it both ways. The script checks that the
+two outputs are byte-identical before it reports anything.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(rows):
+    from django.core.management import call_command
+    from api.models import User, Post
+
+    call_command('migrate', verbosity=0)
+    users = User.objects.bulk_create(
+        User(username=f'user{i}', email=f'user{i}@example.com', bio='bio ' * 20) for i in range(100)
+    )
+    Post.objects.bulk_create(
+        Post(title=f'Post {i}', content='lorem ipsum ' * 40, author=users[i % 100],
+             moderator=users[(i + 1) % 100], moderated=True, like_count=i % 7, comment_count=i % 5)
+        for i in range(rows)
+    )
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def measure(rows, repeat):
+    from django.test import RequestFactory
+    from django.test.utils import override_settings
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.request import Request
+    from api.models import Post
+    from api.renderers import FastJSONRenderer
+    from api.serializers import PostSerializer
+
+    posts = list(Post.objects.select_related('author', 'moderator').order_by('-create_date', '-id')[:rows])
+    request = Request(RequestFactory().get('/api/posts/'))
+
+    def run(renderer):
+        data = PostSerializer(posts, many=True, context={'request': request}).data
+        return renderer.render(data)
+
+    with override_settings(FAST_SERIALIZATION=False):
+        slow, expected = timed(lambda: run(JSONRenderer()), repeat)
+    with override_settings(FAST_SERIALIZATION=True):
+        fast, output = timed(lambda: run(FastJSONRenderer()), repeat)
+    if output != expected:
+        raise SystemExit(f'fast path output differs at {rows} rows')
+    return {
+        'rows': rows,
+        'drf_ms': round(slow * 1000, 2),
+        'fast_ms': round(fast * 1000, 2),
+        'drf_rows_per_s': round(rows / slow),
+        'fast_rows_per_s': round(rows / fast),
+        'speedup': round(slow / fast, 2),
+        'bytes': len(output),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=5, help='best of N runs')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    os.environ.update(DJANGO_SETTINGS_MODULE='benchmarks.settings',
+                      BENCH_DB=os.path.join(workdir, 'bench.sqlite3'))
+    sys.path.insert(0, SERVER_DIR)
+    import django
+    django.setup()
+    seed(max(args.rows))
+
+    results = [measure(rows, args.repeat) for rows in args.rows]
+    columns = ['rows', 'drf_ms', 'fast_ms', 'drf_rows_per_s', 'fast_rows_per_s', 'speedup']
+    print(' '.join(f'{name:>15}' for name in columns))
+    for row in results:
+        print(' '.join(f'{row[name]:>15}' for name in columns))
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
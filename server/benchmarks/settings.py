@@ -0,0 +1,13 @@
+# Settings for benchmark runs: the regular settings against a throwaway
+# SQLite file so seeding never touches db.sqlite3.
+import os
+
+from server.database import sqlite_config
+from server.settings import *  # noqa: F401,F403
+
+DATABASES = {'default': sqlite_config(os.environ.get('BENCH_DB', '/tmp/bench.sqlite3'))}
+DEBUG = False
+ALLOWED_HOSTS = ['*']
+# Load tests drive every client from one address; measure the endpoints,
+# not the throttles
+THROTTLE_BUCKETS = {}
@@ -0,0 +1,39 @@
+# Gunicorn configuration for both serving modes.
+#
+#   SERVER_MODE=asgi gunicorn server.asgi:application   # uvicorn workers, async read views
+#   SERVER_MODE=wsgi gunicorn server.wsgi:application   # threaded sync workers
+#
+# WEB_CONCURRENCY sets the number of worker processes (memory scales with
+# it); WSGI_THREADS sets threads per sync worker.
+import multiprocessing
+import os
+
+mode = os.environ.get('SERVER_MODE', 'asgi')
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+keepalive = 5
+# Recycle workers now and then to cap slow memory growth
+max_requests = 10000
+max_requests_jitter = 1000
+accesslog = '-'
+
+if mode == 'asgi':
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    worker_class = 'gthread'
+    threads = int(os.environ.get('WSGI_THREADS', 4))
+
+
+def on_starting(server):
+    count = server.cfg.workers
+    if count > 1 and not os.environ.get('REDIS_URL'):
+        # Throttle buckets, like coalescing, token versions and the feed
+        # cache all live in the Django cache
+        server.log.warning(
+            'Running %d workers without REDIS_URL: each worker has its own cache, so throttle limits '
+            'are multiplied by %d, like toggles are not coalesced across workers, and token '
+            'revocations reach other workers only when TOKEN_VERSION_CACHE_SECONDS expires.',
+            count, count,
+        )
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .database import database_settings
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,6 +47,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its latency covers the rest of the stack
+    'api.metrics.MetricsMiddleware',
+    # Before anything else that reads or changes the body
+    'api.compression.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -52,6 +59,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.replicas.ReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'server.urls'
@@ -74,16 +82,69 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'server.wsgi.application'
 
+# Serve the read-heavy GET endpoints with async views (api/async_views.py).
+# server/asgi.py turns this on; under WSGI each async view would need its
+# own event loop, so it stays off there.
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS', '') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+# SQLite at db.sqlite3 unless DATABASE_URL is set; see server/database.py
+# for replicas and connection pooling.
+
+DATABASES = database_settings(BASE_DIR)
+
+DATABASE_ROUTERS = ['api.replicas.PrimaryReplicaRouter']
+
+# After a write, keep that client's reads on the primary this long
+REPLICA_STICKY_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Local memory by default; point REDIS_URL at a Redis-compatible server to
+# share the feed cache between workers.
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
     }
-}
+    # Revocations clear the shared copy, except for writes that skip
+    # User.save, so the version still expires now and then
+    TOKEN_VERSION_CACHE_SECONDS = 300
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+    # Each worker keeps its own copy of a user's token version; this is how
+    # long a token revoked through another worker can keep working
+    TOKEN_VERSION_CACHE_SECONDS = 30
+
+# Seconds a cached feed page / post payload is served as fresh, how long
+# past that it may still be served while one worker rebuilds it, and how
+# long that rebuild lock is held at most.
+API_CACHE_TIMEOUT = 60
+API_CACHE_STALE_TIMEOUT = 300
+API_CACHE_LOCK_TIMEOUT = 10
+
+
+# Uploaded images
+# Variants are built by a thread pool after the upload's transaction
+# commits; IMAGE_PROCESS_SYNC builds them inline instead (used by tests).
+# Uploads above FILE_UPLOAD_MAX_MEMORY_SIZE are spooled to disk.
+
+IMAGE_WORKERS = 2
+IMAGE_PROCESS_SYNC = False
+IMAGE_UPLOAD_MAX_BYTES = 20 * 1024 * 1024
+IMAGE_UPLOAD_MAX_PIXELS = 40_000_000
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2_621_440
 
 
 # Password validation
@@ -122,6 +183,21 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploads, stored once per content hash (api/media.py)
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', BASE_DIR / 'media')
+MEDIA_URL = '/media/'
+STORAGES = {
+    'default': {'BACKEND': 'api.media.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+# Let the front server send media files: '' (Django streams them),
+# 'X-Accel-Redirect' (nginx, internal location MEDIA_ACCEL_PREFIX) or
+# 'X-Sendfile' (Apache/lighttpd)
+MEDIA_OFFLOAD = os.environ.get('MEDIA_OFFLOAD', '')
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+# collect_media keeps unreferenced files at least this long
+MEDIA_GC_GRACE_SECONDS = 3600
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -132,14 +208,108 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 # REST Framework settings
+# Opt-in fast read serialization and orjson rendering; output is
+# byte-identical to the default DRF path (api/fastpath.py)
+FAST_SERIALIZATION = os.environ.get('FAST_SERIALIZATION', '') == '1'
+
+# Per-request metrics, JSON request logs and GET /metrics (api/metrics.py).
+# Requests slower than SLOW_REQUEST_SECONDS are logged with their SQL;
+# scraping needs METRICS_TOKEN as a bearer token, or METRICS_PUBLIC=1 to
+# open it to anyone (e.g. when only an internal network can reach it).
+REQUEST_METRICS = os.environ.get('REQUEST_METRICS', '') == '1'
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', '1'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_PUBLIC = os.environ.get('METRICS_PUBLIC', '') == '1'
+
+# Token buckets per scope (api/throttling.py): rate and burst for each
+# key a request is counted against
+THROTTLE_BUCKETS = {
+    'like': {'user': ('120/min', 30), 'ip': ('600/min', 120)},
+    'comment': {'user': ('30/min', 10), 'ip': ('300/min', 60)},
+    # Per request, not per comment: one batch may hold BULK_CREATE_MAX_ITEMS
+    'comment_bulk': {'user': ('10/min', 5), 'ip': ('60/min', 20)},
+    'token': {'username': ('10/min', 5), 'ip': ('60/min', 20)},
+}
+
+# Fold a user's like/unlike toggles on one post within this many seconds
+# into one write (api/likes.py); 0 writes every toggle
+LIKE_COALESCE_SECONDS = float(os.environ.get('LIKE_COALESCE_SECONDS', '0'))
+
+# Event stream (api/events.py). With several workers the events have to
+# cross processes, so REDIS_URL switches the broker to Redis pub/sub.
+if os.environ.get('REDIS_URL'):
+    EVENT_BROKER = 'api.events.RedisBroker'
+    EVENT_BROKER_OPTIONS = {'url': os.environ['REDIS_URL']}
+else:
+    EVENT_BROKER = 'api.events.LocalBroker'
+    EVENT_BROKER_OPTIONS = {}
+# At most one like-count event per post per this many seconds per client
+LIKE_EVENT_INTERVAL = 1.0
+EVENT_HEARTBEAT_SECONDS = 15
+EVENT_MAX_POSTS = 50
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.requests': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'api.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'api.parsers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.ClaimsJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
 }
 
+# Responses of at least this many bytes are sent with brotli or gzip
+# (api/compression.py)
+COMPRESSION_MIN_BYTES = 1024
+COMPRESSION_BROTLI_QUALITY = 4
+COMPRESSION_GZIP_LEVEL = 6
+
+# Moderation queue: how long a claimed batch stays leased to one
+# moderator, and the most posts one claim or bulk moderate may touch
+MODERATION_LEASE_SECONDS = 300
+MODERATION_BATCH_SIZE = 100
+
+# Most objects one POST /api/posts/bulk/ or /api/comments/bulk/ may create
+BULK_CREATE_MAX_ITEMS = 100
+
+# archive_content moves posts with no activity for this many days out of
+# the live tables (api/archive.py)
+ARCHIVE_AFTER_DAYS = 365
+
+# Following feed (api/timelines.py): authors with at least this many
+# followers are merged in at read time instead of fanned out on write,
+# and a new follow copies this many of the author's latest posts
+TIMELINE_FANOUT_LIMIT = 10000
+TIMELINE_BACKFILL_POSTS = 100
+
+# Access tokens carry role/staff/group claims so requests authenticate
+# without loading the user; see api/authentication.py
+SIMPLE_JWT = {
+    'TOKEN_USER_CLASS': 'api.authentication.ClaimsUser',
+    'TOKEN_OBTAIN_SERIALIZER': 'api.authentication.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'api.authentication.ClaimsTokenRefreshSerializer',
+}
+
 # Custom user model
 AUTH_USER_MODEL = 'api.User'
\ No newline at end of file